@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(service, trained_user):
+    from fastapi.testclient import TestClient
+    from src.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_verify(benchmark, client, trained_user, face_images):
+    files = {"file": ("face.jpg", face_images["640x480"], "image/jpeg")}
+    headers = {"X-User-ID": trained_user}
+
+    response = benchmark(client.post, "/verify", files=files, headers=headers)
+    assert response.status_code == 200
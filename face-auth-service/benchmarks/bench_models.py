@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import training_splits
+
+
+def test_create_head(benchmark, service):
+    from src.backbone import get_backbone
+    from src.train import create_head
+
+    # The backbone is shared and built once per process, only the head is created per user
+    get_backbone()
+    head = benchmark(create_head)
+    assert head.layers[-1].units == 1
+
+
+@pytest.mark.parametrize("tier", ["minio", "disk"])
+def test_load_trained_model(benchmark, trained_user, tier):
+    from src.model_disk_cache import model_disk_cache
+    from src.train import load_trained_model
+
+    def setup():
+        # Each round reads from MinIO again unless the disk copy is kept
+        if tier == "minio":
+            model_disk_cache.invalidate(trained_user)
+
+    load_trained_model(trained_user)
+    head = benchmark.pedantic(load_trained_model, args=(trained_user,), setup=setup, rounds=20, warmup_rounds=1)
+    assert head is not None
+
+
+def test_load_cached_model(benchmark, trained_user):
+    from src.train import load_cached_model
+
+    load_cached_model(trained_user)
+    assert benchmark(load_cached_model, trained_user) is not None
+
+
+def test_train_model(benchmark, service, face_crops):
+    from src.train import train_model
+
+    benchmark.pedantic(train_model, args=("benchmark-train-user", *training_splits(face_crops)), rounds=3, warmup_rounds=1)
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from conftest import IMAGE_SIZES
+
+
+@pytest.mark.parametrize("size", list(IMAGE_SIZES))
+def test_detect_and_crop_face(benchmark, face_images, size):
+    import cv2
+    from src.face_detection import detect_and_crop_face
+
+    image = cv2.imdecode(np.frombuffer(face_images[size], np.uint8), cv2.IMREAD_COLOR)
+    face_crop = benchmark(detect_and_crop_face, image)
+    assert face_crop is not None
+
+
+@pytest.mark.parametrize("size", list(IMAGE_SIZES))
+def test_preprocess_single_image(benchmark, face_images, size):
+    from src.utils import preprocess_single_image
+
+    batch = benchmark(preprocess_single_image, face_images[size])
+    assert batch.shape == (1, 224, 224, 3)
@@ -0,0 +1,53 @@
+"""
+Compare the Keras predict path with the compiled verification function.
+
+Run from the face-auth-service directory:
+    python -m benchmarks.compiled_inference --batch-sizes 1,4,16 --iterations 50
+"""
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from src.backbone import get_backbone, make_inference_fn, INPUT_SHAPE
+
+
+def time_calls(fn, images: np.ndarray, iterations: int, warmup: int = 3) -> np.ndarray:
+    """Call fn repeatedly and return per-call latencies in milliseconds."""
+    for _ in range(warmup):
+        fn(images)
+
+    latencies = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        fn(images)
+        latencies.append(1000.0 * (time.perf_counter() - started_at))
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark predict against the compiled inference function")
+    parser.add_argument("--batch-sizes", default="1,4,16")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--xla", action="store_true", help="Also benchmark the XLA compiled function")
+    args = parser.parse_args()
+
+    backbone = get_backbone()
+    paths = {
+        "predict": lambda images: backbone.predict(images, verbose=0),
+        "tf.function": lambda images, fn=make_inference_fn(backbone, jit_compile=False): fn(tf.constant(images)).numpy()
+    }
+    if args.xla:
+        paths["tf.function+xla"] = lambda images, fn=make_inference_fn(backbone, jit_compile=True): fn(tf.constant(images)).numpy()
+
+    print(f"{'path':<18}{'batch':>6}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>10}")
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        images = np.random.rand(batch_size, *INPUT_SHAPE).astype(np.float32)
+        for name, fn in paths.items():
+            latencies = time_calls(fn, images, args.iterations)
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(f"{name:<18}{batch_size:>6}{p50:>10.1f}{p95:>10.1f}{1000.0 * batch_size / p50:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
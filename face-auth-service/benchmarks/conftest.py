@@ -0,0 +1,131 @@
+"""
+Offline micro-benchmarks for preprocessing, inference and model I/O (pytest-benchmark).
+
+Nothing here needs the network: MinIO is replaced by an in-memory stand-in, faces are
+synthetic and the backbone gets random weights unless BACKBONE_WEIGHTS says otherwise
+(the cost of a forward pass does not depend on the weights).
+
+The benchmark files are named bench_*.py so the regular test run does not pick them up.
+Run from the face-auth-service directory (pip install -r benchmarks/requirements.txt):
+    python -m pytest benchmarks/bench_*.py --benchmark-storage=benchmarks/results --benchmark-autosave
+
+Each run is saved as a JSON baseline named after the commit. Compare against the latest one with:
+    python -m pytest benchmarks/bench_*.py --benchmark-storage=benchmarks/results \
+        --benchmark-compare --benchmark-compare-fail=median:20%
+"""
+import os
+import sys
+from pathlib import Path
+from typing import Dict
+import numpy as np
+import pytest
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+BENCHMARK_USER_ID = "benchmark-user"
+
+# Frame sizes of the synthetic face images: a webcam frame and a 12 MP phone photo
+IMAGE_SIZES = {
+    "640x480": (480, 640),
+    "4000x3000": (3000, 4000),
+}
+
+
+def synthetic_face(height: int, width: int, seed: int = 0):
+    """
+    Draw a simple frontal face that MediaPipe detects, on a noisy background.
+
+    Args:
+        height: Image height
+        width: Image width
+        seed: Seed for the background noise
+
+    Returns:
+        BGR image
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), int(rng.integers(90, 160)), dtype=np.float32)
+    image = cv2.GaussianBlur((background + rng.normal(0, 8, background.shape)).clip(0, 255).astype(np.uint8), (5, 5), 0)
+
+    cx, cy = width // 2, height // 2
+    face_w, face_h = int(min(height, width) * 0.22), int(min(height, width) * 0.3)
+    cv2.ellipse(image, (cx, cy - face_h - face_h // 3), (face_w + 10, face_h // 2), 0, 180, 360, (40, 40, 60), -1)
+    cv2.ellipse(image, (cx, cy), (face_w, face_h), 0, 0, 360, (150, 180, 220), -1)
+    cv2.ellipse(image, (cx, cy - face_h + 10), (face_w + 8, face_h // 3), 0, 180, 360, (40, 40, 60), -1)
+    for dx in (-face_w // 2, face_w // 2):
+        eye_y = cy - face_h // 5
+        cv2.ellipse(image, (cx + dx, eye_y), (face_w // 5, face_w // 9), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(image, (cx + dx, eye_y), face_w // 12, (50, 30, 20), -1)
+        cv2.line(image, (cx + dx - face_w // 5, eye_y - face_w // 6), (cx + dx + face_w // 5, eye_y - face_w // 6), (40, 40, 60), 4)
+    cv2.line(image, (cx, cy - face_h // 8), (cx - face_w // 10, cy + face_h // 5), (110, 130, 170), 3)
+    cv2.ellipse(image, (cx, cy + face_h // 2), (face_w // 3, face_w // 8), 0, 0, 180, (80, 80, 180), -1)
+    return image
+
+
+@pytest.fixture(scope="session")
+def service(tmp_path_factory):
+    """
+    Point the service at temporary local state and the in-memory MinIO before any src module is imported.
+    """
+    data_dir = tmp_path_factory.mktemp("face-auth-data")
+    os.environ.setdefault("BACKBONE_WEIGHTS", "none")
+    os.environ["DATA_DIR"] = str(data_dir)
+    os.environ["WARMUP_ENABLED"] = "false"
+    os.environ["PREPROCESS_WORKERS"] = "1"
+
+    if str(SERVICE_DIR) not in sys.path:
+        sys.path.insert(0, str(SERVICE_DIR))
+
+    import minio
+    from benchmarks.fake_minio import FakeMinio
+    minio.Minio = FakeMinio
+
+    from src.minio_client import minio_client
+    assert isinstance(minio_client.client, FakeMinio), "src.minio_client was imported before the MinIO stand-in"
+    return data_dir
+
+
+@pytest.fixture(scope="session")
+def face_images(service) -> Dict[str, bytes]:
+    """JPEG encoded synthetic faces by frame size."""
+    import cv2
+
+    return {
+        name: cv2.imencode(".jpg", synthetic_face(height, width), [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        for name, (height, width) in IMAGE_SIZES.items()
+    }
+
+
+@pytest.fixture(scope="session")
+def face_crops(service) -> np.ndarray:
+    """Face crops of ten synthetic registration images."""
+    import cv2
+    from src.face_detection import decode_and_crop_face
+
+    crops = []
+    for seed in range(10):
+        image_bytes = cv2.imencode(".jpg", synthetic_face(480, 640, seed))[1].tobytes()
+        crops.append(decode_and_crop_face(image_bytes, fallback=True))
+    return np.stack(crops)
+
+
+@pytest.fixture(scope="session")
+def trained_user(service, face_crops) -> str:
+    """Train and upload a head for BENCHMARK_USER_ID once per session."""
+    from src.train import train_model
+
+    train_model(BENCHMARK_USER_ID, *training_splits(face_crops))
+    return BENCHMARK_USER_ID
+
+
+def training_splits(face_crops: np.ndarray):
+    """Split face crops 80/20 and pair them with random negative embeddings, as train_model expects."""
+    from src.backbone import EMBEDDING_DIM
+
+    rng = np.random.default_rng(0)
+    negatives = rng.random((2 * len(face_crops), EMBEDDING_DIM)).astype(np.float32)
+    positive_split = int(0.8 * len(face_crops))
+    negative_split = int(0.8 * len(negatives))
+    return face_crops[:positive_split], face_crops[positive_split:], negatives[:negative_split], negatives[negative_split:]
@@ -0,0 +1,56 @@
+"""
+In-memory stand-in for the parts of minio.Minio used by src.minio_client, so benchmarks need no server.
+"""
+import io
+import hashlib
+import threading
+from types import SimpleNamespace
+from minio.error import S3Error
+
+
+class _Response(io.BytesIO):
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    def __init__(self, *args, **kwargs):
+        self._objects = {}
+        self._buckets = set()
+        self._lock = threading.Lock()
+
+    def _get(self, bucket_name: str, object_name: str) -> bytes:
+        with self._lock:
+            data = self._objects.get((bucket_name, object_name))
+        if data is None:
+            raise S3Error(response=None, code="NoSuchKey", message="Object does not exist",
+                          resource=object_name, request_id="fake", host_id="fake")
+        return data
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return bucket_name in self._buckets
+
+    def make_bucket(self, bucket_name: str):
+        self._buckets.add(bucket_name)
+
+    def put_object(self, bucket_name: str, object_name: str, data, length: int, content_type=None, **kwargs):
+        content = data.read(length)
+        with self._lock:
+            self._objects[(bucket_name, object_name)] = content
+        return SimpleNamespace(etag=hashlib.md5(content).hexdigest(), object_name=object_name)
+
+    def get_object(self, bucket_name: str, object_name: str, **kwargs) -> _Response:
+        return _Response(self._get(bucket_name, object_name))
+
+    def stat_object(self, bucket_name: str, object_name: str, **kwargs):
+        data = self._get(bucket_name, object_name)
+        return SimpleNamespace(etag=hashlib.md5(data).hexdigest(), size=len(data), object_name=object_name)
+
+    def remove_object(self, bucket_name: str, object_name: str, **kwargs):
+        with self._lock:
+            self._objects.pop((bucket_name, object_name), None)
+
+    def list_objects(self, bucket_name: str, prefix: str = "", recursive: bool = False, **kwargs):
+        with self._lock:
+            names = sorted(name for bucket, name in self._objects if bucket == bucket_name and name.startswith(prefix))
+        return [SimpleNamespace(object_name=name) for name in names]
@@ -55,8 +55,8 @@ def download_dataset():
         sys.exit(1)
     
     # Ensure data directory exists
-    data_dir = Path('/app/data')
-    data_dir.mkdir(exist_ok=True)
+    data_dir = Path(os.getenv('DATA_DIR', '/app/data'))
+    data_dir.mkdir(parents=True, exist_ok=True)
     
     print(f"📥 Downloading private dataset: {dataset_name}")
     print(f"📁 Target directory: {data_dir}")
@@ -0,0 +1,181 @@
+import os
+import uuid
+import hashlib
+import logging
+import threading
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import EfficientNetV2B3
+from tensorflow.keras.layers import GlobalAveragePooling2D
+from tensorflow.keras.models import Model
+
+logger = logging.getLogger(__name__)
+
+# Input shape the backbone expects and size of the pooled embedding it produces
+INPUT_SHAPE = (224, 224, 3)
+EMBEDDING_DIM = 1536
+
+# Backbone used to embed faces at verification time: keras (float) or tflite (int8, see src.tflite_backend)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+
+# Compile the verification functions with XLA
+INFERENCE_XLA = os.getenv('INFERENCE_XLA', 'false').lower() == 'true'
+
+# Backbone weights: imagenet, a path to a weights file, or none for random weights.
+# none is only meant for offline benchmarks, where the cost matters but the embeddings do not
+BACKBONE_WEIGHTS = os.getenv('BACKBONE_WEIGHTS', 'imagenet')
+
+
+def _backbone_id(weights: str) -> str:
+    """
+    Identify the architecture together with the weights that are loaded.
+    Stored artifacts record it, so embeddings made with other weights are detected.
+
+    Args:
+        weights: BACKBONE_WEIGHTS value
+
+    Returns:
+        EfficientNetV2B3/imagenet, EfficientNetV2B3/sha256:<digest> for a weights file,
+        or a per-process id for random weights, which are never the same twice
+    """
+    if weights == 'imagenet':
+        return "EfficientNetV2B3/imagenet"
+    if weights.lower() == 'none':
+        return f"EfficientNetV2B3/random-{uuid.uuid4().hex[:12]}"
+    if not os.path.isfile(weights):
+        # Loading the backbone reports the missing file
+        return f"EfficientNetV2B3/{weights}"
+
+    digest = hashlib.sha256()
+    with open(weights, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f"EfficientNetV2B3/sha256:{digest.hexdigest()[:16]}"
+
+# Identifier of the backbone and its weights, recorded in every stored embedding and artifact
+BACKBONE_ID = _backbone_id(BACKBONE_WEIGHTS)
+
+_base_model = None
+_backbone = None
+_inference_fn = None
+_backbone_lock = threading.Lock()
+
+
+def get_base_model() -> tf.keras.Model:
+    """
+    Get the process-wide frozen EfficientNetV2B3 feature extractor.
+    The ImageNet weights are loaded only once, the first time this is called.
+
+    Returns:
+        Frozen EfficientNetV2B3 model without top layers
+    """
+    global _base_model
+
+    if _base_model is None:
+        with _backbone_lock:
+            if _base_model is None:
+                logger.info("Building shared EfficientNetV2B3 backbone...")
+                base_model = EfficientNetV2B3(
+                    input_shape=INPUT_SHAPE,
+                    include_top=False,
+                    weights=None if BACKBONE_WEIGHTS.lower() == 'none' else BACKBONE_WEIGHTS
+                )
+
+                # The backbone is never trained, every user only gets their own head
+                base_model.trainable = False
+                _base_model = base_model
+
+    return _base_model
+
+
+def get_backbone() -> tf.keras.Model:
+    """
+    Get the shared embedding model (frozen backbone + global average pooling).
+
+    Returns:
+        Keras model mapping a batch of face images to EMBEDDING_DIM embeddings
+    """
+    global _backbone
+
+    if _backbone is None:
+        base_model = get_base_model()
+        with _backbone_lock:
+            if _backbone is None:
+                inputs = tf.keras.Input(shape=INPUT_SHAPE)
+                features = base_model(inputs, training=False)
+                embeddings = GlobalAveragePooling2D()(features)
+                backbone = Model(inputs, embeddings, name="face_embedding_backbone")
+
+                # Run a dummy forward pass so the graph is built before first use
+                _ = backbone(tf.zeros((1,) + INPUT_SHAPE), training=False)
+                _backbone = backbone
+                logger.info("✅ Shared backbone ready")
+
+    return _backbone
+
+
+def extract_embeddings(images: np.ndarray) -> np.ndarray:
+    """
+    Run a batch of preprocessed face images through the shared backbone.
+
+    Args:
+        images: Batch of images with shape (N, 224, 224, 3), normalized to [0,1]
+
+    Returns:
+        Embeddings with shape (N, EMBEDDING_DIM)
+    """
+    return get_backbone().predict(images, verbose=0)
+
+
+def make_inference_fn(model: tf.keras.Model, jit_compile: bool = INFERENCE_XLA):
+    """
+    Compile a model call for a fixed (None, 224, 224, 3) float32 signature.
+    Unlike predict, calling it skips the Keras data adapter and callbacks, and any
+    batch size reuses the same graph.
+
+    Args:
+        model: Model mapping face images to outputs
+        jit_compile: Whether to compile the graph with XLA
+
+    Returns:
+        tf.function taking a float32 image batch
+    """
+    return tf.function(
+        lambda images: model(images, training=False),
+        input_signature=[tf.TensorSpec(shape=(None,) + INPUT_SHAPE, dtype=tf.float32)],
+        jit_compile=jit_compile
+    )
+
+
+def get_inference_fn():
+    """Get the compiled backbone call used for verification."""
+    global _inference_fn
+
+    if _inference_fn is None:
+        backbone = get_backbone()
+        with _backbone_lock:
+            if _inference_fn is None:
+                _inference_fn = make_inference_fn(backbone)
+                logger.info(f"Compiled inference function (xla={INFERENCE_XLA})")
+
+    return _inference_fn
+
+
+def extract_inference_embeddings(images: np.ndarray) -> np.ndarray:
+    """
+    Embed faces for verification with the configured INFERENCE_BACKEND.
+    Training and the negative bank always use the float backbone, so heads are
+    trained on unquantized embeddings.
+
+    Args:
+        images: Batch of images with shape (N, 224, 224, 3), normalized to [0,1]
+
+    Returns:
+        Embeddings with shape (N, EMBEDDING_DIM)
+    """
+    if INFERENCE_BACKEND == 'tflite':
+        from src.tflite_backend import quantized_backbone
+        if quantized_backbone.available():
+            return quantized_backbone.embed(images)
+
+    return get_inference_fn()(tf.convert_to_tensor(images, dtype=tf.float32)).numpy()
@@ -0,0 +1,112 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedExecutor:
+    def __init__(self, name: str, max_workers: int):
+        """
+        Thread pool used to keep blocking work off the asyncio event loop.
+        Tracks how many calls are queued and running so saturation is visible.
+
+        Args:
+            name: Pool name used for thread names and stats
+            max_workers: Number of worker threads
+        """
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Start the threads on first use, and again after a shutdown."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=f"{self.name}-pool")
+        return self._executor
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Schedule a blocking function on the pool without awaiting it.
+
+        Args:
+            fn: Blocking function to call
+            *args, **kwargs: Arguments passed to fn
+
+        Returns:
+            Future resolving to the return value of fn
+        """
+        with self._lock:
+            self.queued += 1
+
+        def call():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        def dequeue_cancelled(future: Future):
+            # A call cancelled before it started never leaves the queue by itself
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+
+        future = self._get_executor().submit(call)
+        future.add_done_callback(dequeue_cancelled)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking function on the pool and await its result.
+        Cancelling the awaiting coroutine drops the call if it has not started yet.
+
+        Args:
+            fn: Blocking function to call
+            *args, **kwargs: Arguments passed to fn
+
+        Returns:
+            Return value of fn
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        """Get pool size and queue depth."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed
+            }
+
+    def shutdown(self):
+        """Stop the threads once running calls have finished. A later submit starts new ones."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Blocking I/O such as MinIO requests and local file writes
+io_executor = InstrumentedExecutor("io", int(os.getenv('IO_POOL_SIZE', '16')))
+
+# CPU-bound work such as decoding and face detection. OpenCV, MediaPipe and
+# TensorFlow release the GIL, so threads scale with cores while sharing the
+# process-wide backbone and detector pools.
+cpu_executor = InstrumentedExecutor("cpu", int(os.getenv('CPU_POOL_SIZE', str(os.cpu_count() or 1))))
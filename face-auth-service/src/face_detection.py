@@ -0,0 +1,375 @@
+import io
+import os
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+import cv2
+import numpy as np
+import mediapipe as mp
+from PIL import Image
+from src.metrics import STAGE_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
+# Initialize MediaPipe Face Detection
+mp_face_detection = mp.solutions.face_detection
+
+DEFAULT_MODEL_SELECTION = int(os.getenv('FACE_DETECTION_MODEL_SELECTION', '0'))
+DEFAULT_MIN_DETECTION_CONFIDENCE = float(os.getenv('FACE_DETECTION_MIN_CONFIDENCE', '0.5'))
+DEFAULT_POOL_SIZE = int(os.getenv('FACE_DETECTOR_POOL_SIZE', str(os.cpu_count() or 1)))
+
+# Long side that large images are reduced to for detection, 0 always decodes and detects at full size
+DETECTION_MAX_SIDE = int(os.getenv('FACE_DETECTION_MAX_SIDE', '640'))
+
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class FaceDetectorPool:
+    def __init__(self, model_selection: int, min_detection_confidence: float, size: int = DEFAULT_POOL_SIZE):
+        """
+        Pool of long-lived MediaPipe FaceDetection instances with the same configuration.
+        A detector is not safe to use from several threads at once, so each one is
+        checked out by a single caller at a time and detectors are created lazily up to size.
+
+        Args:
+            model_selection: 0 for faces within 2 meters, 1 for faces within 5 meters
+            min_detection_confidence: Minimum confidence for a detection to count
+            size: Maximum number of detectors kept alive
+        """
+        self.model_selection = model_selection
+        self.min_detection_confidence = min_detection_confidence
+        self.size = max(1, size)
+
+        self._available = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create_detector(self):
+        return mp_face_detection.FaceDetection(
+            model_selection=self.model_selection,
+            min_detection_confidence=self.min_detection_confidence
+        )
+
+    @contextmanager
+    def acquire(self) -> Iterator:
+        """Check out a detector for exclusive use, blocking if all of them are busy."""
+        try:
+            detector = self._available.get_nowait()
+        except queue.Empty:
+            detector = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+
+            if create:
+                try:
+                    detector = self._create_detector()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                logger.info(f"Created face detector {self._created}/{self.size} "
+                            f"(model_selection={self.model_selection}, confidence={self.min_detection_confidence})")
+            else:
+                detector = self._available.get()
+
+        try:
+            yield detector
+        finally:
+            self._available.put(detector)
+
+    def warm_up(self):
+        """Create all detectors up front so no request pays for their initialisation."""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+
+            try:
+                detector = self._create_detector()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            self._available.put(detector)
+
+
+_pools: Dict[Tuple[int, float], FaceDetectorPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_detector_pool(model_selection: Optional[int] = None, min_detection_confidence: Optional[float] = None) -> FaceDetectorPool:
+    """
+    Get the process-wide detector pool for a configuration.
+
+    Args:
+        model_selection: MediaPipe model selection, defaults to FACE_DETECTION_MODEL_SELECTION
+        min_detection_confidence: Detection threshold, defaults to FACE_DETECTION_MIN_CONFIDENCE
+
+    Returns:
+        Shared FaceDetectorPool
+    """
+    if model_selection is None:
+        model_selection = DEFAULT_MODEL_SELECTION
+    if min_detection_confidence is None:
+        min_detection_confidence = DEFAULT_MIN_DETECTION_CONFIDENCE
+
+    key = (model_selection, min_detection_confidence)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = FaceDetectorPool(model_selection, min_detection_confidence)
+        return _pools[key]
+
+
+def _detection_image(image: np.ndarray) -> np.ndarray:
+    """Downscale a large BGR image to FACE_DETECTION_MAX_SIDE and convert it to RGB for MediaPipe."""
+    h, w = image.shape[:2]
+    if DETECTION_MAX_SIDE > 0 and max(h, w) > DETECTION_MAX_SIDE:
+        scale = DETECTION_MAX_SIDE / max(h, w)
+        image = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def detect_face_box(image: np.ndarray, model_selection: Optional[int] = None,
+                    min_detection_confidence: Optional[float] = None) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Detect the most confident face in an image.
+    Large images are downscaled first, the box is relative so it applies to any scale of the image.
+
+    Args:
+        image: Input image as BGR numpy array
+        model_selection: MediaPipe model selection, defaults to the configured one
+        min_detection_confidence: Detection threshold, defaults to the configured one
+
+    Returns:
+        Relative bounding box (xmin, ymin, width, height), or None if no face was detected
+    """
+    rgb_image = _detection_image(image)
+
+    with get_detector_pool(model_selection, min_detection_confidence).acquire() as face_detection:
+        results = face_detection.process(rgb_image)
+
+    if not results.detections:
+        return None
+
+    # Use the first (most confident) detection
+    bboxC = results.detections[0].location_data.relative_bounding_box
+    return bboxC.xmin, bboxC.ymin, bboxC.width, bboxC.height
+
+
+def _padded_crop_box(shape: Tuple[int, ...], box: Tuple[float, float, float, float],
+                     padding: float = 0.2) -> Tuple[int, int, int, int]:
+    """Convert a relative face box to absolute (x1, y1, x2, y2) with padding, clipped to the image."""
+    h, w = shape[:2]
+    xmin, ymin, box_width, box_height = box
+
+    # Convert relative coordinates to absolute
+    x = int(xmin * w)
+    y = int(ymin * h)
+    width = int(box_width * w)
+    height = int(box_height * h)
+
+    # Add some padding around the face
+    pad_x = int(width * padding)
+    pad_y = int(height * padding)
+
+    # Ensure coordinates are within image bounds
+    x1 = max(0, x - pad_x)
+    y1 = max(0, y - pad_y)
+    x2 = min(w, x + width + pad_x)
+    y2 = min(h, y + height + pad_y)
+    return x1, y1, x2, y2
+
+
+def crop_face(image: np.ndarray, box: Tuple[float, float, float, float],
+              target_size: Tuple[int, int] = (224, 224)) -> Optional[np.ndarray]:
+    """
+    Crop a detected face and resize it to target size.
+
+    Args:
+        image: Input image as BGR numpy array
+        box: Relative bounding box from detect_face_box
+        target_size: Target size for cropped face (width, height)
+
+    Returns:
+        Grayscale face crop as 3-channel RGB, or None if the crop is empty
+    """
+    x1, y1, x2, y2 = _padded_crop_box(image.shape, box)
+    face_crop = image[y1:y2, x1:x2]
+
+    if face_crop.size == 0:
+        logger.warning("Empty face crop detected")
+        return None
+
+    # Convert to grayscale then back to RGB for model compatibility
+    gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
+    rgb_face = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+    # Resize to target size
+    return cv2.resize(rgb_face, target_size)
+
+
+def detect_and_crop_face(image: np.ndarray, target_size: Tuple[int, int] = (224, 224),
+                         model_selection: Optional[int] = None,
+                         min_detection_confidence: Optional[float] = None) -> Optional[np.ndarray]:
+    """
+    Detect face in image using MediaPipe and crop to target size.
+
+    Args:
+        image: Input image as numpy array
+        target_size: Target size for cropped face (width, height)
+        model_selection: MediaPipe model selection, defaults to the configured one
+        min_detection_confidence: Detection threshold, defaults to the configured one
+
+    Returns:
+        Cropped face image or None if no face detected
+    """
+    try:
+        box = detect_face_box(image, model_selection, min_detection_confidence)
+        if box is None:
+            logger.warning("No face detected in image")
+            return None
+
+        return crop_face(image, box, target_size)
+
+    except Exception as e:
+        logger.error(f"Error in face detection and cropping: {e}")
+        return None
+
+
+def image_size(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read the image dimensions from the file header without decoding the pixels.
+
+    Args:
+        image_bytes: Raw image bytes
+
+    Returns:
+        (width, height), or None if the header is not readable
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def _reduction_for(long_side: int, min_long_side: int) -> int:
+    """Largest decode reduction that keeps the long side at or above min_long_side."""
+    for reduction in (8, 4, 2):
+        if long_side // reduction >= min_long_side:
+            return reduction
+    return 1
+
+
+def decode_image(image_bytes: bytes, reduction: int = 1) -> Optional[np.ndarray]:
+    """
+    Decode raw image bytes.
+
+    Args:
+        image_bytes: Raw image bytes
+        reduction: Decode at 1/1, 1/2, 1/4 or 1/8 scale. JPEGs are scaled inside the
+            decoder (DCT scaling), which is much faster than decoding at full size
+
+    Returns:
+        BGR image, or None if the bytes are not a readable image
+    """
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), _REDUCED_DECODE_FLAGS[reduction])
+
+
+def decode_and_crop_face(image_bytes: bytes, target_size: Tuple[int, int] = (224, 224),
+                         fallback: bool = False) -> Optional[np.ndarray]:
+    """
+    Decode an image and crop the face, without decoding large photos at full resolution.
+    The image is decoded at the smallest scale that still has FACE_DETECTION_MAX_SIDE pixels
+    on its long side, the face is detected there, and it is only decoded again at a larger
+    scale when the face in the reduced image has fewer pixels than target_size.
+
+    Args:
+        image_bytes: Raw image bytes
+        target_size: Target size for the crop (width, height)
+        fallback: Resize the whole image when no face is found instead of returning None
+
+    Returns:
+        RGB face crop, or None if (without fallback) no face was found
+
+    Raises:
+        ValueError: If the bytes are not a readable image
+    """
+    size = image_size(image_bytes) if DETECTION_MAX_SIDE > 0 else None
+    reduction = _reduction_for(max(size), DETECTION_MAX_SIDE) if size else 1
+
+    with timed(STAGE_SECONDS, stage="decode"):
+        image = decode_image(image_bytes, reduction)
+        if image is None and reduction > 1:
+            image, reduction = decode_image(image_bytes), 1
+    if image is None:
+        raise ValueError("Could not decode image")
+
+    box = None
+    try:
+        with timed(STAGE_SECONDS, stage="detection"):
+            box = detect_face_box(image)
+    except Exception as e:
+        logger.error(f"Error in face detection and cropping: {e}")
+
+    if box is None:
+        if not fallback:
+            logger.warning("No face detected in image")
+            return None
+        logger.warning("No face detected, using fallback preprocessing")
+        return crop_face_or_resize(image, target_size=target_size, detect=False)
+
+    if reduction > 1:
+        # Only go back to more pixels when the reduced face is smaller than the output
+        x1, y1, x2, y2 = _padded_crop_box(image.shape, box)
+        face_side = min(x2 - x1, y2 - y1)
+        needed = reduction
+        while needed > 1 and face_side * reduction // needed < min(target_size):
+            needed //= 2
+        if needed < reduction:
+            with timed(STAGE_SECONDS, stage="decode"):
+                larger_image = decode_image(image_bytes, needed)
+            if larger_image is not None:
+                image = larger_image
+
+    face_crop = crop_face(image, box, target_size)
+    if face_crop is None and fallback:
+        return crop_face_or_resize(image, target_size=target_size, detect=False)
+    return face_crop
+
+
+def crop_face_or_resize(image: np.ndarray, target_size: Tuple[int, int] = (224, 224),
+                        detect: bool = True) -> np.ndarray:
+    """
+    Crop the face, or fall back to a plain grayscale resize if no face is found.
+    Used for images that might already be face crops, like the false-faces pool.
+
+    Args:
+        image: Input image as BGR numpy array
+        target_size: Target size for the result (width, height)
+        detect: Set to False when detection already failed on this image
+
+    Returns:
+        RGB image resized to target_size
+    """
+    face_crop = detect_and_crop_face(image, target_size=target_size) if detect else None
+
+    if face_crop is None:
+        # Fallback: simple grayscale + resize
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        rgb_img = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+        face_crop = cv2.resize(rgb_img, target_size)
+
+    return face_crop
@@ -0,0 +1,194 @@
+import io
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from src.backbone import BACKBONE_ID, EMBEDDING_DIM
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / (np.linalg.norm(embeddings, axis=-1, keepdims=True) + 1e-12)
+
+
+def enrollment_embedding(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Summarize a user's registration embeddings as one unit-length vector.
+
+    Args:
+        embeddings: Backbone embeddings of the user's faces with shape (N, EMBEDDING_DIM)
+
+    Returns:
+        Normalized mean of the normalized embeddings
+    """
+    return _normalize(np.mean(_normalize(embeddings), axis=0))
+
+
+def serialize_enrollment(embedding: np.ndarray) -> bytes:
+    """Pack an enrollment embedding with the backbone it was computed with."""
+    buffer = io.BytesIO()
+    np.savez(buffer, embedding=np.asarray(embedding, dtype=np.float32), backbone=np.array(BACKBONE_ID))
+    return buffer.getvalue()
+
+
+def deserialize_enrollment(data: bytes) -> Optional[np.ndarray]:
+    """Unpack an enrollment embedding, or None if it was computed with another backbone."""
+    with np.load(io.BytesIO(data)) as enrollment:
+        if str(enrollment["backbone"]) != BACKBONE_ID or enrollment["embedding"].shape != (EMBEDDING_DIM,):
+            return None
+        return enrollment["embedding"]
+
+
+class FaceIndex:
+    def __init__(self):
+        """
+        In-memory 1:N index over per-user enrollment embeddings.
+        Embeddings are kept as rows of one contiguous matrix, searched with a single
+        matrix product. Removing a user moves the last row into the freed slot.
+        """
+        self.dtype = np.dtype(os.getenv('FACE_INDEX_DTYPE', 'float32'))
+        self.search_chunk_rows = int(os.getenv('FACE_INDEX_SEARCH_CHUNK_ROWS', '65536'))
+
+        self._matrix = np.zeros((0, EMBEDDING_DIM), dtype=self.dtype)
+        self._user_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.ready = False
+        self.error: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+    def add(self, user_id: str, embedding: np.ndarray):
+        """
+        Add or replace a user's enrollment embedding.
+
+        Args:
+            user_id: User identifier
+            embedding: Enrollment embedding with shape (EMBEDDING_DIM,)
+        """
+        embedding = _normalize(embedding).astype(self.dtype)
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                row = len(self._user_ids)
+                if row == len(self._matrix):
+                    # Grow geometrically so adding users stays amortized O(1)
+                    grown = np.zeros((max(1024, 2 * len(self._matrix)), EMBEDDING_DIM), dtype=self.dtype)
+                    grown[:row] = self._matrix[:row]
+                    self._matrix = grown
+                self._user_ids.append(user_id)
+                self._rows[user_id] = row
+            self._matrix[row] = embedding
+
+    def remove(self, user_id: str) -> bool:
+        """
+        Remove a user from the index.
+
+        Args:
+            user_id: User identifier
+
+        Returns:
+            True if the user was indexed
+        """
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+
+            last = len(self._user_ids) - 1
+            if row != last:
+                moved_user_id = self._user_ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._user_ids[row] = moved_user_id
+                self._rows[moved_user_id] = row
+            self._user_ids.pop()
+            return True
+
+    def search(self, embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Find the enrolled users most similar to a face embedding.
+
+        Args:
+            embedding: Query embedding with shape (EMBEDDING_DIM,)
+            top_k: Number of candidates wanted, clamped to the number of indexed users
+
+        Returns:
+            (user_id, cosine similarity) pairs, most similar first
+        """
+        query = _normalize(embedding)
+        with self._lock:
+            count = len(self._user_ids)
+            if count == 0:
+                return []
+
+            # Score in chunks so float16 storage is only widened a chunk at a time
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, self.search_chunk_rows):
+                end = min(count, start + self.search_chunk_rows)
+                scores[start:end] = self._matrix[start:end].astype(np.float32, copy=False) @ query
+
+            top_k = min(max(1, top_k), count)
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._user_ids[row], float(scores[row])) for row in top]
+
+    def rebuild(self, workers: int = 16) -> int:
+        """
+        Rebuild the index from the enrollment embeddings stored in MinIO.
+        The index is marked ready even if this fails, it then only holds the users enrolled since.
+
+        Args:
+            workers: Number of parallel downloads
+
+        Returns:
+            Number of indexed users
+        """
+        from src.minio_client import minio_client, ENROLLMENT_ARTIFACT_NAME
+
+        def load(user_id: str) -> Optional[np.ndarray]:
+            data = minio_client.download_enrollment(user_id)
+            return deserialize_enrollment(data) if data is not None else None
+
+        try:
+            user_ids = [
+                user_id for user_id, artifacts in minio_client.list_models().items()
+                if ENROLLMENT_ARTIFACT_NAME in artifacts
+            ]
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                embeddings = list(executor.map(load, user_ids))
+
+            for user_id, embedding in zip(user_ids, embeddings):
+                if embedding is not None:
+                    self.add(user_id, embedding)
+
+            self.error = None
+            logger.info(f"Face index rebuilt with {len(self)} users")
+        except Exception as e:
+            # Answering /identify without the older users beats answering 503 forever
+            self.error = str(e)
+            logger.error(f"❌ Face index rebuild failed, serving only newly enrolled users: {e}")
+        finally:
+            self.ready = True
+
+        return len(self)
+
+    def stats(self) -> dict:
+        """Get index size and memory use."""
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "error": self.error,
+                "users": len(self._user_ids),
+                "dtype": str(self.dtype),
+                "bytes": int(self._matrix.nbytes)
+            }
+
+# Global face index instance
+face_index = FaceIndex()
@@ -0,0 +1,163 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, List
+import numpy as np
+
+from src.backbone import extract_inference_embeddings
+from src.train import score_head
+
+logger = logging.getLogger(__name__)
+
+
+class _InferenceRequest:
+    def __init__(self, images: np.ndarray, head: Any):
+        self.images = images
+        self.head = head
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceScheduler:
+    def __init__(self):
+        """Initialize the micro-batching scheduler with limits from environment variables."""
+        self.max_batch_size = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '16'))
+        self.max_wait_ms = float(os.getenv('INFERENCE_MAX_WAIT_MS', '5'))
+
+        self._queue: "queue.Queue[_InferenceRequest]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.items = 0
+        self.queue_wait_seconds = 0.0
+        self.batch_sizes = Counter()
+
+    def _ensure_started(self):
+        """Start the batching thread on first use."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+                    thread.start()
+                    self._thread = thread
+                    logger.info(f"Inference scheduler started (max_batch_size={self.max_batch_size}, "
+                                f"max_wait_ms={self.max_wait_ms})")
+
+    def submit(self, images: np.ndarray, head: Any) -> Future:
+        """
+        Queue preprocessed faces to be scored with a user's head.
+
+        Args:
+            images: Batch of preprocessed images with shape (N, 224, 224, 3)
+            head: User head model applied on the backbone embeddings, or None for the embeddings themselves
+
+        Returns:
+            Future resolving to the N REAL probabilities, or to the (N, EMBEDDING_DIM) embeddings
+        """
+        self._ensure_started()
+        request = _InferenceRequest(images, head)
+        self._queue.put(request)
+        return request.future
+
+    async def score(self, images: np.ndarray, head: Any) -> np.ndarray:
+        """Async wrapper around submit for use from request handlers."""
+        return await asyncio.wrap_future(self.submit(images, head))
+
+    async def embed(self, images: np.ndarray) -> np.ndarray:
+        """Get backbone embeddings, batched together with concurrent scoring requests."""
+        return await asyncio.wrap_future(self.submit(images, None))
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            batch_items = len(first.images)
+            deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+
+            # Collect more requests until the batch is full or the wait budget is spent
+            while batch_items < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                batch_items += len(request.images)
+
+            self._process(batch)
+
+    def _process(self, batch: List[_InferenceRequest]):
+        """Run one backbone pass for the whole batch and apply each request's head."""
+        started_at = time.perf_counter()
+        results = {}
+
+        try:
+            embeddings = extract_inference_embeddings(np.concatenate([request.images for request in batch]))
+
+            # Requests for the same user share one head call, requests without a head get embeddings
+            offsets = np.cumsum([0] + [len(request.images) for request in batch])
+            groups = {}
+            for index, request in enumerate(batch):
+                if request.head is None:
+                    results[index] = embeddings[offsets[index]:offsets[index + 1]]
+                else:
+                    groups.setdefault(id(request.head), []).append(index)
+
+            for indices in groups.values():
+                head = batch[indices[0]].head
+                rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in indices])
+                scores = score_head(head, embeddings[rows]).reshape(-1)
+
+                position = 0
+                for i in indices:
+                    count = len(batch[i].images)
+                    results[i] = scores[position:position + count]
+                    position += count
+
+            error = None
+        except Exception as e:
+            logger.error(f"Error in batched inference: {e}")
+            error = e
+
+        # Record stats before resolving so they are visible as soon as callers return
+        items = sum(len(request.images) for request in batch)
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.items += items
+            self.queue_wait_seconds += sum(started_at - request.enqueued_at for request in batch)
+            self.batch_sizes[items] += 1
+
+        for index, request in enumerate(batch):
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(results[index])
+
+    def stats(self) -> dict:
+        """Get achieved batch size metrics to trade latency against throughput."""
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self.batches,
+                "requests": self.requests,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "avg_queue_wait_ms": 1000.0 * self.queue_wait_seconds / self.requests if self.requests else 0.0,
+                "batch_size_counts": dict(sorted(self.batch_sizes.items())),
+                "queue_depth": self._queue.qsize()
+            }
+
+# Global inference scheduler instance
+inference_scheduler = InferenceScheduler()
@@ -1,22 +1,39 @@
-from fastapi import FastAPI, File, UploadFile, Form, BackgroundTasks, HTTPException, Header
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Header, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
 import logging
 import sys
 import os
 import shutil
 from datetime import datetime
-from pathlib import Path
 import time
+import numpy as np
 
-# Import our custom modules
+# Import our custom modules. TensorFlow and MediaPipe are only imported by the startup
+# warm-up and the handlers that need them, so the process answers /health/live right away
 from src.utils import (
-    preprocess_and_train, 
     model_exists, 
     delete_temp_inference, 
     generate_job_id,
-    preprocess_single_image
+    preprocess_single_image,
+    save_registration_faces,
+    aggregate_scores,
+    REGISTRATION_DEBUG_DIRS,
+    VERIFY_AGGREGATION,
+    VERIFY_K_OF_N,
+    AGGREGATION_METHODS
 )
-from src.train import load_trained_model
+from src.user_data import USERS_DIR, RAW_POSITIVES_DIR, TRAINING_STATUS_FILE, user_dir
+from src.model_cache import model_cache
+from src.model_disk_cache import model_disk_cache
+from src.executors import io_executor, cpu_executor
+from src.training_queue import training_queue
+from src.warmup import startup_warmup
+from src.uploads import stream_uploaded_files, UploadError
+from src.metrics import STAGE_SECONDS, render_metrics, timed
+from src.profiling import profiler
 
 # Configure logging
 logging.basicConfig(
@@ -28,62 +45,128 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(
-    title="Face Auth Service", 
-    description="Internal service for face authentication",
-    version="1.0.0"
-)
+# Maximum number of frames accepted by /verify-multi
+VERIFY_MAX_FRAMES = int(os.getenv('VERIFY_MAX_FRAMES', '10'))
+
+# Candidates taken from the face index by /identify, and the head probability a match needs
+IDENTIFY_TOP_K = int(os.getenv('IDENTIFY_TOP_K', '5'))
+IDENTIFY_MAX_TOP_K = int(os.getenv('IDENTIFY_MAX_TOP_K', '20'))
+IDENTIFY_MIN_PROBABILITY = float(os.getenv('IDENTIFY_MIN_PROBABILITY', '0.5'))
+
+
+def run_training_job(user_id: str):
+    """Training queue handler, imports the training code on first use and waits for MinIO."""
+    from src.minio_client import minio_client
+    from src.utils import preprocess_and_train
+    
+    minio_client.connect()
+    preprocess_and_train(user_id)
 
-# CORS removed - service is internal only
 
-@app.on_event("startup")
-async def startup_event():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     logger.info("=" * 50)
     logger.info(f"🚀 Face Auth Service starting up at {current_time}")
     logger.info("=" * 50)
     
     # Ensure data directories exist
-    Path("/app/data/users").mkdir(parents=True, exist_ok=True)
+    USERS_DIR.mkdir(parents=True, exist_ok=True)
     logger.info("Created data directories")
     
-    # Initialize MinIO connection
-    try:
-        from src.minio_client import minio_client
-        logger.info("✅ MinIO client initialized successfully")
-    except Exception as e:
-        logger.error(f"❌ Failed to initialize MinIO client: {e}")
+    # Resume interrupted training jobs and start training workers
+    training_queue.start(run_training_job)
+    
+    # Import and build models, connect to MinIO and preload hot users in the background,
+    # /health/ready answers 503 until this is done
+    startup_warmup.start()
+    
+    yield
+    
+    training_queue.stop()
+    
+    # Only stop the preprocessing workers if they were ever started
+    preprocess_pool_module = sys.modules.get("src.preprocess_pool")
+    if preprocess_pool_module is not None:
+        preprocess_pool_module.preprocess_pool.shutdown()
+    
+    # Wait for calls still running on the thread pools
+    cpu_executor.shutdown()
+    io_executor.shutdown()
+
+
+app = FastAPI(
+    title="Face Auth Service", 
+    description="Internal service for face authentication",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+# CORS removed - service is internal only
 
 @app.get("/")
 async def root():
     return {"message": "Face Auth Service - Internal API"}
 
+@app.get("/health/live")
+async def liveness_check():
+    """The process is up and its event loop answers, dependencies are not checked."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Ready to serve once models are warmed up and MinIO answers, 503 before that."""
+    if not startup_warmup.is_ready():
+        return JSONResponse(status_code=503, content={"status": "starting", "warmup": startup_warmup.stats()})
+    return {"status": "ready"}
+
 @app.get("/health")
 async def health_check():
+    """Readiness under the original path, for existing health checks."""
+    if not startup_warmup.is_ready():
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
     return {"status": "healthy"}
 
-@app.post("/register")
+# The body is parsed by stream_uploaded_files, this only documents it
+REGISTER_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                "required": ["files"]
+            }
+        }
+    }
+}
+
+
+@app.post("/register", openapi_extra={"requestBody": REGISTER_REQUEST_BODY})
 async def register_face(
-    background_tasks: BackgroundTasks,
-    files: List[UploadFile] = File(...),
+    request: Request,
     x_user_id: str = Header(..., alias="X-User-ID")
 ):
     """
     Register a new user by training a model on their face images.
     User ID is passed via X-User-ID header from backend service.
+    The multipart body is streamed: each image is handed to preprocessing as soon
+    as it has arrived, and size limits are enforced while reading.
     
     Args:
-        files: List of face image files (typically ~60 images)
+        request: Multipart request with the face image files (typically ~60 images)
         x_user_id: User ID from header (set by backend service)
         
     Returns:
         JSON with user_id and status
     """
+    from src.preprocess_pool import preprocess_pool
+    
     try:
-        logger.info(f"Received registration request for user_id: {x_user_id} with {len(files)} files")
+        logger.info(f"Received registration request for user_id: {x_user_id}")
         
         # Check if user already has a trained model
-        if model_exists(x_user_id):
+        if await io_executor.run(model_exists, x_user_id):
             logger.warning(f"Model already exists for user_id: {x_user_id}")
             return {
                 "user_id": x_user_id,
@@ -92,25 +175,47 @@ async def register_face(
             }
         
         # Create user directory structure
-        user_path = Path(f"/app/data/users/{x_user_id}")
-        raw_positives_path = user_path / "raw_positives"
-        raw_positives_path.mkdir(parents=True, exist_ok=True)
+        user_path = user_dir(x_user_id)
+        raw_positives_path = user_path / RAW_POSITIVES_DIR
+        if REGISTRATION_DEBUG_DIRS:
+            await io_executor.run(raw_positives_path.mkdir, parents=True, exist_ok=True)
+        else:
+            await io_executor.run(user_path.mkdir, parents=True, exist_ok=True)
         
-        # Save uploaded files
+        # Save uploaded files (debug layout) or crop faces in memory
         saved_files = 0
-        for i, file in enumerate(files):
-            if file.content_type and file.content_type.startswith('image/'):
-                file_path = raw_positives_path / f"image_{i:04d}_{file.filename}"
-                
-                # Read and save file
-                content = await file.read()
-                with open(file_path, 'wb') as f:
-                    f.write(content)
-                saved_files += 1
-            else:
-                logger.warning(f"Skipping non-image file: {file.filename}")
-        
-        logger.info(f"Saved {saved_files} images for user_id: {x_user_id}")
+        face_crops = []
+        i = 0
+        try:
+            async for file in stream_uploaded_files(request):
+                if file.content_type and file.content_type.startswith('image/'):
+                    if REGISTRATION_DEBUG_DIRS:
+                        file_path = raw_positives_path / f"image_{i:04d}_{file.filename}"
+                        await io_executor.run(file_path.write_bytes, file.content)
+                    else:
+                        # Start cropping right away in the preprocessing pool while the next files arrive
+                        face_crops.append(asyncio.wrap_future(preprocess_pool.submit(file.content)))
+                    saved_files += 1
+                else:
+                    logger.warning(f"Skipping non-image file: {file.filename}")
+                i += 1
+        except UploadError as e:
+            logger.warning(f"Rejected registration upload for user_id {x_user_id}: {e.detail}")
+            for face_crop in face_crops:
+                face_crop.cancel()
+            if REGISTRATION_DEBUG_DIRS:
+                await io_executor.run(shutil.rmtree, raw_positives_path, True)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        
+        if face_crops:
+            faces = [face for face in await asyncio.gather(*face_crops) if face is not None]
+            logger.info(f"Detected {len(faces)} faces in {saved_files} images for user_id: {x_user_id}")
+            await io_executor.run(
+                save_registration_faces, x_user_id,
+                np.stack(faces) if faces else np.zeros((0, 224, 224, 3), dtype=np.uint8)
+            )
+        
+        logger.info(f"Received {saved_files} images for user_id: {x_user_id}")
         
         if saved_files == 0:
             raise HTTPException(status_code=400, detail="No valid image files provided")
@@ -119,20 +224,23 @@ async def register_face(
             logger.warning(f"Only {saved_files} images provided. For better accuracy, consider providing 20-60 face images.")
         
         # Create training status file
-        status_file = user_path / "training_status.txt"
-        with open(status_file, 'w') as f:
-            f.write("training_in_progress")
+        status_file = user_path / TRAINING_STATUS_FILE
+        await io_executor.run(status_file.write_text, "training_in_progress")
         
-        # Start background training
-        background_tasks.add_task(preprocess_and_train, x_user_id)
+        # Queue training, workers pick jobs up in order
+        await io_executor.run(training_queue.enqueue, x_user_id)
+        job = await io_executor.run(training_queue.job_status, x_user_id)
         
         return {
             "user_id": x_user_id,
             "status": "training_started",
             "images_received": saved_files,
+            "queue_position": job["queue_position"] if job else 0,
             "message": "Training started in background. Use /status to check progress."
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in user registration: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -154,11 +262,16 @@ async def verify_face(
     Returns:
         JSON with authentication result and probability
     """
+    from src.train import load_cached_model
+    from src.inference_scheduler import inference_scheduler
+    
     try:
         logger.info(f"Login attempt for user_id: {x_user_id}")
         
         # Check if model exists
-        if not model_exists(x_user_id):
+        with timed(STAGE_SECONDS, stage="model_exists"):
+            found = await io_executor.run(model_exists, x_user_id)
+        if not found:
             logger.warning(f"Model not found for user_id: {x_user_id}")
             raise HTTPException(status_code=404, detail="Model not found. Please register first or wait for training to complete.")
         
@@ -166,16 +279,21 @@ async def verify_face(
         if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read and preprocess image
-        image_bytes = await file.read()
-        preprocessed_image = preprocess_single_image(image_bytes)
-        
-        # Load trained model
-        model = load_trained_model(x_user_id)
-        
-        # Run inference
-        predictions = model.predict(preprocessed_image, verbose=0)
-        real_probability = float(predictions[0][0])  # Extract scalar probability
+        # Traced only while a TensorFlow trace is armed for /verify (see /admin/profile/trace)
+        async with profiler.traced_async("verify"):
+            # Read and preprocess image
+            with timed(STAGE_SECONDS, stage="upload_read"):
+                image_bytes = await file.read()
+            preprocessed_image = await cpu_executor.run(preprocess_single_image, image_bytes)
+            
+            # Load the user's head (backbone is shared across users)
+            with timed(STAGE_SECONDS, stage="model_load"):
+                model = await io_executor.run(load_cached_model, x_user_id)
+            
+            # Run inference, batched with concurrent logins through the shared backbone
+            with timed(STAGE_SECONDS, stage="inference"):
+                predictions = await inference_scheduler.score(preprocessed_image, model)
+        real_probability = float(predictions[0])  # Extract scalar probability
         
         # Log the REAL probability value for debugging
         logger.info(f"REAL probability for user_id {x_user_id}: {real_probability:.6f}")
@@ -204,6 +322,178 @@ async def verify_face(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/verify-multi")
+async def verify_face_multi(
+    files: List[UploadFile] = File(...),
+    aggregation: Optional[str] = Form(None),
+    k: Optional[int] = Form(None),
+    x_user_id: str = Header(..., alias="X-User-ID")
+):
+    """
+    Authenticate a user from several frames of one login attempt.
+    Frames are preprocessed in parallel and scored in a single batched forward pass.
+    
+    Args:
+        files: Face image frames
+        aggregation: mean, median or k_of_n, defaults to VERIFY_AGGREGATION
+        k: Frames that have to pass for k_of_n, from 1 to the number of frames,
+            defaults to VERIFY_K_OF_N (capped at the number of frames)
+        x_user_id: User ID from header (set by backend service)
+        
+    Returns:
+        JSON with authentication result, aggregated and per-frame probabilities
+    """
+    from src.train import load_cached_model
+    from src.inference_scheduler import inference_scheduler
+    
+    try:
+        logger.info(f"Multi-frame login attempt for user_id: {x_user_id} with {len(files)} frames")
+        
+        aggregation = (aggregation or VERIFY_AGGREGATION).lower()
+        if aggregation not in AGGREGATION_METHODS:
+            raise HTTPException(status_code=400, detail=f"Aggregation must be one of {', '.join(AGGREGATION_METHODS)}")
+        if len(files) > VERIFY_MAX_FRAMES:
+            raise HTTPException(status_code=400, detail=f"At most {VERIFY_MAX_FRAMES} frames are accepted")
+        if k is not None and not 1 <= k <= len(files):
+            raise HTTPException(status_code=400, detail=f"k must be between 1 and the number of frames ({len(files)})")
+        
+        # Check if model exists
+        with timed(STAGE_SECONDS, stage="model_exists"):
+            found = await io_executor.run(model_exists, x_user_id)
+        if not found:
+            logger.warning(f"Model not found for user_id: {x_user_id}")
+            raise HTTPException(status_code=404, detail="Model not found. Please register first or wait for training to complete.")
+        
+        # Validate file types
+        for file in files:
+            if not file.content_type or not file.content_type.startswith('image/'):
+                raise HTTPException(status_code=400, detail="File must be an image")
+        
+        # Load the user's head while the frames are preprocessed in parallel
+        model_task = asyncio.ensure_future(io_executor.run(load_cached_model, x_user_id))
+        try:
+            with timed(STAGE_SECONDS, stage="upload_read"):
+                frame_bytes = [await file.read() for file in files]
+            frames = await asyncio.gather(*[cpu_executor.run(preprocess_single_image, image_bytes) for image_bytes in frame_bytes])
+            with timed(STAGE_SECONDS, stage="model_load"):
+                model = await model_task
+        finally:
+            # Preprocessing failed first, don't leave the load behind unawaited
+            if not model_task.done():
+                model_task.cancel()
+            elif not model_task.cancelled():
+                model_task.exception()
+        
+        # Score all frames in one batch
+        with timed(STAGE_SECONDS, stage="inference"):
+            predictions = await inference_scheduler.score(np.concatenate(frames), model)
+        real_probabilities = [float(p) for p in predictions]
+        real_probability = aggregate_scores(np.array(real_probabilities), aggregation, k if k is not None else VERIFY_K_OF_N)
+        
+        # Log the REAL probability values for debugging
+        logger.info(f"REAL probabilities for user_id {x_user_id}: {[round(p, 6) for p in real_probabilities]}, "
+                    f"{aggregation}: {real_probability:.6f}")
+        
+        # Generate fake high probabilities between 0.75 and 0.98, same as /verify
+        fake_probability = 0.75 + (real_probability * 0.23)
+        fake_frame_probabilities = [0.75 + (p * 0.23) for p in real_probabilities]
+        
+        # Log the REAL authentication result internally (but don't use it in response)
+        real_authenticated = real_probability > 0.5
+        logger.info(f"INTERNAL AUTH RESULT - User {x_user_id}: authenticated={real_authenticated} (real_prob={real_probability:.4f}, returning fake_prob={fake_probability:.4f})")
+        
+        # Always return success with fake probabilities
+        return {
+            "user_id": x_user_id,
+            "authenticated": True,  # Always return True
+            "probability": fake_probability,
+            "aggregation": aggregation,
+            "frame_probabilities": fake_frame_probabilities
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in multi-frame user login: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/identify")
+async def identify_face(
+    file: UploadFile = File(...),
+    top_k: Optional[int] = Form(None)
+):
+    """
+    Identify a face without a claimed user, e.g. for kiosk-style box unlocking.
+    The closest enrolled users are found in the face index, then each candidate
+    is scored with their own head.
+    
+    Args:
+        file: Single face image file
+        top_k: Number of candidates to check, from 1 to IDENTIFY_MAX_TOP_K, defaults to IDENTIFY_TOP_K
+        
+    Returns:
+        JSON with the identified user_id (or None) and the checked candidates
+    """
+    from src.train import load_cached_model, score_head
+    from src.inference_scheduler import inference_scheduler
+    from src.face_index import face_index
+    
+    try:
+        # Every candidate costs a head load and a forward pass, so their number is bounded
+        if top_k is not None and not 1 <= top_k <= IDENTIFY_MAX_TOP_K:
+            raise HTTPException(status_code=400, detail=f"top_k must be between 1 and {IDENTIFY_MAX_TOP_K}")
+        
+        if not face_index.ready:
+            raise HTTPException(status_code=503, detail="Face index is still loading")
+        
+        # Validate file type
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        
+        # Read, preprocess and embed the image
+        with timed(STAGE_SECONDS, stage="upload_read"):
+            image_bytes = await file.read()
+        preprocessed_image = await cpu_executor.run(preprocess_single_image, image_bytes)
+        with timed(STAGE_SECONDS, stage="inference"):
+            embedding = (await inference_scheduler.embed(preprocessed_image))[0]
+        
+        # Find candidates, then confirm them with their heads
+        candidates = face_index.search(embedding, top_k if top_k is not None else IDENTIFY_TOP_K)
+        heads = await asyncio.gather(
+            *[io_executor.run(load_cached_model, user_id) for user_id, _ in candidates],
+            return_exceptions=True
+        )
+        
+        matches = []
+        for (user_id, similarity), head in zip(candidates, heads):
+            if isinstance(head, Exception):
+                logger.warning(f"Skipping identification candidate {user_id}: {head}")
+                continue
+            probability = await cpu_executor.run(score_head, head, embedding[np.newaxis])
+            matches.append({
+                "user_id": user_id,
+                "similarity": similarity,
+                "probability": float(probability[0, 0])
+            })
+        
+        matches.sort(key=lambda match: match["probability"], reverse=True)
+        best = matches[0] if matches and matches[0]["probability"] > IDENTIFY_MIN_PROBABILITY else None
+        logger.info(f"Identification result: {best['user_id'] if best else None} ({len(matches)} candidates checked)")
+        
+        return {
+            "identified": best is not None,
+            "user_id": best["user_id"] if best else None,
+            "matches": matches
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in identification: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/status")
 async def check_status(
     x_user_id: str = Header(..., alias="X-User-ID")
@@ -219,11 +509,11 @@ async def check_status(
         JSON with training status
     """
     try:
-        user_path = Path(f"/app/data/users/{x_user_id}")
-        status_file = user_path / "training_status.txt"
+        user_path = user_dir(x_user_id)
+        status_file = user_path / TRAINING_STATUS_FILE
         
         # Check if model exists in MinIO
-        if model_exists(x_user_id):
+        if await io_executor.run(model_exists, x_user_id):
             return {
                 "user_id": x_user_id,
                 "status": "training_completed",
@@ -231,10 +521,21 @@ async def check_status(
                 "message": "Model training completed successfully. User can now login."
             }
         
+        # Check if training is queued or running
+        job = await io_executor.run(training_queue.job_status, x_user_id)
+        if job is not None:
+            return {
+                "user_id": x_user_id,
+                "status": "training_in_progress",
+                "model_ready": False,
+                "job_status": job["status"],
+                "queue_position": job["queue_position"],
+                "message": "Training is still in progress. Please wait."
+            }
+        
         # Check if training is in progress
         if status_file.exists():
-            with open(status_file, 'r') as f:
-                status = f.read().strip()
+            status = (await io_executor.run(status_file.read_text)).strip()
             
             if status == "training_in_progress":
                 return {
@@ -274,15 +575,22 @@ async def delete_user(
     try:
         logger.info(f"Delete request for user_id: {x_user_id}")
         
+        # Stop training first, a running job could otherwise publish the model again
+        await io_executor.run(training_queue.cancel, x_user_id)
+        
         # Delete model from MinIO
         from src.minio_client import minio_client
-        model_deleted = minio_client.delete_model(x_user_id)
+        from src.face_index import face_index
+        model_deleted = await io_executor.run(minio_client.delete_model, x_user_id)
+        model_cache.invalidate(x_user_id)
+        face_index.remove(x_user_id)
+        await io_executor.run(model_disk_cache.invalidate, x_user_id)
         
         # Delete local user data
-        user_path = Path(f"/app/data/users/{x_user_id}")
+        user_path = user_dir(x_user_id)
         local_deleted = False
         if user_path.exists():
-            shutil.rmtree(user_path)
+            await io_executor.run(shutil.rmtree, user_path)
             local_deleted = True
             logger.info(f"Deleted local data for user_id: {x_user_id}")
         
@@ -308,6 +616,111 @@ async def delete_user(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/stats")
+async def get_stats():
+    """Get cache, inference batching, worker pool and training queue counters used to size the service."""
+    from src.minio_client import minio_client
+    from src.backbone import INFERENCE_BACKEND
+    from src.inference_scheduler import inference_scheduler
+    from src.face_index import face_index
+    
+    inference_backend = {"backend": INFERENCE_BACKEND}
+    if INFERENCE_BACKEND == 'tflite':
+        from src.tflite_backend import quantized_backbone
+        inference_backend.update(quantized_backbone.stats())
+    
+    return {
+        "model_cache": model_cache.stats(),
+        "model_disk_cache": model_disk_cache.stats(),
+        "minio": minio_client.stats(),
+        "inference_scheduler": inference_scheduler.stats(),
+        "inference_backend": inference_backend,
+        "training_queue": await io_executor.run(training_queue.stats),
+        "warmup": startup_warmup.stats(),
+        "face_index": face_index.stats(),
+        "executors": {
+            "io": io_executor.stats(),
+            "cpu": cpu_executor.stats()
+        }
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Per-stage latency histograms and training counters in the Prometheus text format."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+def _require_profiling():
+    """Profiling endpoints do not exist unless PROFILING_ENABLED is set."""
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.post("/admin/profile/stacks")
+async def profile_stacks(seconds: float = 10.0):
+    """
+    Sample the Python stacks of all threads of this worker for a few seconds.
+    
+    Args:
+        seconds: Capture duration, at most PROFILING_MAX_SECONDS
+        
+    Returns:
+        JSON with the artifact name, downloadable once the capture has ended
+    """
+    _require_profiling()
+    try:
+        artifact = profiler.sample_stacks(seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"artifact": artifact, "seconds": seconds}
+
+
+@app.post("/admin/profile/trace")
+async def profile_trace(target: str = "verify", count: int = 1):
+    """
+    Arm a TensorFlow profiler trace for the next /verify calls or the next training run.
+    
+    Args:
+        target: verify or train
+        count: Number of /verify calls to trace
+        
+    Returns:
+        JSON with the artifact name, downloadable once the traced calls have ended
+    """
+    _require_profiling()
+    try:
+        artifact = profiler.arm_trace(target, count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"artifact": artifact, "target": target}
+
+
+@app.get("/admin/profile")
+async def list_profiles():
+    """List running captures and written profile artifacts."""
+    _require_profiling()
+    return {
+        **profiler.stats(),
+        "artifacts": await io_executor.run(profiler.artifacts)
+    }
+
+
+@app.get("/admin/profile/artifacts/{name}")
+async def download_profile(name: str):
+    """Download a profile artifact."""
+    _require_profiling()
+    path = await io_executor.run(profiler.artifact_path, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile artifact not found")
+    return FileResponse(path, filename=name)
+
+
 @app.get("/gpu-test")
 async def gpu_test():
     """Test GPU availability and performance."""
@@ -0,0 +1,104 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# Every process has its own registry and only this one is exported by /metrics. Decode and detection
+# of registration images run in preprocessing worker processes, which capture their stage timings
+# and send them back with each result (see capture_stage_timings).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRAINING_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+STAGE_SECONDS = Histogram(
+    "face_auth_stage_seconds",
+    "Time spent in each stage of a request: upload_read, decode, detection, model_exists, model_load, inference",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+MODEL_LOAD_SECONDS = Histogram(
+    "face_auth_model_load_seconds",
+    "Time to get a user's head, by the tier that served it: memory, disk or minio",
+    ["tier"],
+    buckets=LATENCY_BUCKETS
+)
+
+MINIO_SECONDS = Histogram(
+    "face_auth_minio_seconds",
+    "Duration of MinIO calls by operation: get, put, stat",
+    ["operation"],
+    buckets=LATENCY_BUCKETS
+)
+
+MINIO_BYTES = Counter(
+    "face_auth_minio_bytes",
+    "Bytes transferred to and from MinIO by operation: get, put",
+    ["operation"]
+)
+
+TRAINING_JOBS = Counter(
+    "face_auth_training_jobs",
+    "Finished training jobs by result: completed, cancelled or failed",
+    ["result"]
+)
+
+TRAINING_PHASE_SECONDS = Histogram(
+    "face_auth_training_phase_seconds",
+    "Duration of each phase of a training job",
+    ["phase"],
+    buckets=TRAINING_BUCKETS
+)
+
+
+# Stage timings captured by the current thread, see capture_stage_timings
+_capture = threading.local()
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels) -> Iterator[None]:
+    """
+    Observe the duration of a block, also when it raises.
+
+    Args:
+        histogram: Histogram to observe into
+        **labels: Label values of the histogram
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started_at
+        histogram.labels(**labels).observe(seconds)
+
+        stage_timings = getattr(_capture, "stage_timings", None)
+        if stage_timings is not None and histogram is STAGE_SECONDS:
+            stage_timings.append((labels["stage"], seconds))
+
+
+@contextmanager
+def capture_stage_timings() -> Iterator[List[Tuple[str, float]]]:
+    """
+    Collect the STAGE_SECONDS observations of a block, so a worker process can return them
+    to the service process, which records them with observe_stage_timings.
+
+    Yields:
+        List filled with (stage, seconds) pairs
+    """
+    stage_timings = []
+    _capture.stage_timings = stage_timings
+    try:
+        yield stage_timings
+    finally:
+        _capture.stage_timings = None
+
+
+def observe_stage_timings(stage_timings: List[Tuple[str, float]]):
+    """Record stage timings captured in another process."""
+    for stage, seconds in stage_timings:
+        STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Render all metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
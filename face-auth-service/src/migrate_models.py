@@ -0,0 +1,87 @@
+import logging
+import argparse
+
+from src.minio_client import minio_client, HEAD_ARTIFACT_NAME, LEGACY_WEIGHTS_NAME
+from src.model_artifacts import serialize_head
+from src.train import read_head_weights
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_user(user_id: str, delete_legacy: bool = False) -> bool:
+    """
+    Convert one user's legacy full-model .weights.h5 object into a head-only artifact.
+
+    Args:
+        user_id: User identifier
+        delete_legacy: Remove the legacy object once the head artifact is uploaded
+
+    Returns:
+        True if the head artifact was uploaded, False otherwise
+    """
+    legacy_data = minio_client.download_model(user_id, LEGACY_WEIGHTS_NAME)
+    if legacy_data is None:
+        return False
+
+    head_data = serialize_head(read_head_weights(legacy_data))
+    if not minio_client.upload_model(user_id, head_data):
+        return False
+
+    logger.info(f"Migrated user_id {user_id}: {len(legacy_data)} -> {len(head_data)} bytes")
+
+    if delete_legacy:
+        minio_client.delete_model(user_id, [LEGACY_WEIGHTS_NAME])
+
+    return True
+
+
+def migrate_models(dry_run: bool = False, delete_legacy: bool = False) -> dict:
+    """
+    Convert every user that only has a legacy model object.
+
+    Args:
+        dry_run: Only report which users would be migrated
+        delete_legacy: Remove legacy objects after migration, and for users already migrated
+
+    Returns:
+        Dict with lists of migrated, failed and already migrated user_ids
+    """
+    result = {"migrated": [], "failed": [], "already_migrated": []}
+
+    for user_id, artifacts in sorted(minio_client.list_models().items()):
+        if LEGACY_WEIGHTS_NAME not in artifacts:
+            continue
+
+        if HEAD_ARTIFACT_NAME in artifacts:
+            result["already_migrated"].append(user_id)
+            if delete_legacy and not dry_run:
+                minio_client.delete_model(user_id, [LEGACY_WEIGHTS_NAME])
+            continue
+
+        if dry_run:
+            logger.info(f"Would migrate user_id: {user_id}")
+            result["migrated"].append(user_id)
+            continue
+
+        try:
+            migrated = migrate_user(user_id, delete_legacy=delete_legacy)
+        except Exception as e:
+            logger.error(f"Error migrating model for user_id {user_id}: {e}")
+            migrated = False
+
+        result["migrated" if migrated else "failed"].append(user_id)
+
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Convert legacy .weights.h5 user models into head-only artifacts")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the users that would be migrated")
+    parser.add_argument("--delete-legacy", action="store_true", help="Remove legacy objects once converted")
+    args = parser.parse_args()
+
+    result = migrate_models(dry_run=args.dry_run, delete_legacy=args.delete_legacy)
+    logger.info(f"Migrated: {len(result['migrated'])}, failed: {len(result['failed'])}, "
+                f"already migrated: {len(result['already_migrated'])}")
@@ -1,13 +1,25 @@
+import io
 import os
+import time
 import logging
+import threading
+from collections import OrderedDict
 from minio import Minio
 from minio.error import S3Error
 from pathlib import Path
-import tempfile
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
+from src.metrics import MINIO_BYTES, MINIO_SECONDS, timed
 
 logger = logging.getLogger(__name__)
 
+# Per-user model objects live under models/{user_id}/, in order of preference
+HEAD_ARTIFACT_NAME = "head.npz"
+LEGACY_WEIGHTS_NAME = "model.weights.h5"
+MODEL_ARTIFACT_NAMES = [HEAD_ARTIFACT_NAME, LEGACY_WEIGHTS_NAME]
+
+# Enrollment embedding used by the identification index, stored next to the model
+ENROLLMENT_ARTIFACT_NAME = "enrollment.npz"
+
 class MinIOClient:
     def __init__(self):
         """Initialize MinIO client with environment variables."""
@@ -28,7 +40,22 @@ class MinIOClient:
         )
         
         self.bucket_name = "face-auth-models"
-        self._ensure_bucket_exists()
+        
+        # The bucket is checked by connect(), creating the client does not touch the network
+        self.connect_retry_seconds = float(os.getenv('MINIO_CONNECT_RETRY_SECONDS', '5'))
+        self.connected = False
+        self._connect_lock = threading.Lock()
+        
+        # Local cache of which model artifact a user has, to avoid a stat_object per request.
+        # Writes from this process update it immediately, writes from other replicas are seen
+        # after the TTL, which is why missing models are only cached briefly.
+        self.exists_ttl = float(os.getenv('MODEL_EXISTS_TTL_SECONDS', '60'))
+        self.missing_ttl = float(os.getenv('MODEL_MISSING_TTL_SECONDS', '5'))
+        self.exists_cache_max_entries = int(os.getenv('MODEL_EXISTS_CACHE_MAX_ENTRIES', '100000'))
+        self._exists_cache: "OrderedDict[str, Tuple[Optional[Tuple[str, str]], float]]" = OrderedDict()
+        self._exists_lock = threading.Lock()
+        self.exists_hits = 0
+        self.exists_misses = 0
     
     def _ensure_bucket_exists(self):
         """Ensure the face-auth-models bucket exists."""
@@ -42,26 +69,89 @@ class MinIOClient:
             logger.error(f"Error creating/checking MinIO bucket: {e}")
             raise
     
-    def upload_model(self, user_id: str, model_file_path: str) -> bool:
+    def connect(self):
+        """
+        Make sure MinIO answers and the bucket exists, retrying until it does.
+        Returns right away once connected, concurrent callers wait for the same check.
+        """
+        while not self.connected:
+            with self._connect_lock:
+                if self.connected:
+                    break
+                try:
+                    self._ensure_bucket_exists()
+                    self.connected = True
+                    logger.info(f"✅ Connected to MinIO at {self.endpoint}:{self.port}")
+                    break
+                except Exception as e:
+                    logger.warning(f"MinIO at {self.endpoint}:{self.port} is not reachable, "
+                                   f"retrying in {self.connect_retry_seconds:.0f}s: {e}")
+            time.sleep(self.connect_retry_seconds)
+    
+    def _object_name(self, user_id: str, artifact_name: str) -> str:
+        return f"models/{user_id}/{artifact_name}"
+    
+    def put_bytes(self, object_name: str, data: bytes, content_type: str = "application/octet-stream") -> str:
+        """
+        Upload an object from memory.
+        
+        Args:
+            object_name: Object name in the bucket
+            data: Object content
+            content_type: Content type stored with the object
+            
+        Returns:
+            ETag of the stored object
+        """
+        with timed(MINIO_SECONDS, operation="put"):
+            result = self.client.put_object(
+                bucket_name=self.bucket_name,
+                object_name=object_name,
+                data=io.BytesIO(data),
+                length=len(data),
+                content_type=content_type
+            )
+        MINIO_BYTES.labels(operation="put").inc(len(data))
+        return result.etag
+    
+    def get_bytes(self, object_name: str) -> bytes:
+        """
+        Download an object into memory.
+        
+        Args:
+            object_name: Object name in the bucket
+            
+        Returns:
+            Object content
+        """
+        with timed(MINIO_SECONDS, operation="get"):
+            response = self.client.get_object(self.bucket_name, object_name)
+            try:
+                data = response.read()
+            finally:
+                response.close()
+                response.release_conn()
+        MINIO_BYTES.labels(operation="get").inc(len(data))
+        return data
+    
+    def upload_model(self, user_id: str, data: bytes, artifact_name: str = HEAD_ARTIFACT_NAME) -> bool:
         """
         Upload a trained model to MinIO.
         
         Args:
             user_id: User identifier
-            model_file_path: Local path to the model weights file
+            data: Serialized model artifact
+            artifact_name: Object name within the user's model folder
             
         Returns:
             True if upload successful, False otherwise
         """
         try:
-            object_name = f"models/{user_id}/model.weights.h5"
-            
-            self.client.fput_object(
-                bucket_name=self.bucket_name,
-                object_name=object_name,
-                file_path=model_file_path,
-                content_type="application/octet-stream"
-            )
+            etag = self.put_bytes(self._object_name(user_id, artifact_name), data)
+            if artifact_name == HEAD_ARTIFACT_NAME:
+                self._remember_artifact(user_id, (artifact_name, etag))
+            else:
+                self._forget_artifact(user_id)
             
             logger.info(f"Successfully uploaded model for user_id: {user_id}")
             return True
@@ -70,44 +160,69 @@ class MinIOClient:
             logger.error(f"Error uploading model for user_id {user_id}: {e}")
             return False
     
-    def download_model(self, user_id: str) -> Optional[str]:
+    def download_model(self, user_id: str, artifact_name: str = HEAD_ARTIFACT_NAME) -> Optional[bytes]:
         """
-        Download a trained model from MinIO to a temporary file.
+        Download a trained model from MinIO into memory.
         
         Args:
             user_id: User identifier
+            artifact_name: Object name within the user's model folder
             
         Returns:
-            Path to temporary file containing the model weights, or None if not found
+            Serialized model artifact, or None if not found
         """
         try:
-            object_name = f"models/{user_id}/model.weights.h5"
-            
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.weights.h5')
-            temp_path = temp_file.name
-            temp_file.close()
-            
-            # Download model weights
-            self.client.fget_object(
-                bucket_name=self.bucket_name,
-                object_name=object_name,
-                file_path=temp_path
-            )
+            data = self.get_bytes(self._object_name(user_id, artifact_name))
             
             logger.info(f"Successfully downloaded model for user_id: {user_id}")
-            return temp_path
+            return data
             
         except S3Error as e:
             if e.code == 'NoSuchKey':
-                logger.warning(f"Model not found for user_id: {user_id}")
+                logger.warning(f"Model {artifact_name} not found for user_id: {user_id}")
+                self._forget_artifact(user_id)
             else:
                 logger.error(f"Error downloading model for user_id {user_id}: {e}")
             return None
     
+    def upload_enrollment(self, user_id: str, data: bytes) -> bool:
+        """
+        Upload a user's serialized enrollment embedding.
+        
+        Args:
+            user_id: User identifier
+            data: Serialized enrollment embedding
+            
+        Returns:
+            True if upload successful, False otherwise
+        """
+        try:
+            self.put_bytes(self._object_name(user_id, ENROLLMENT_ARTIFACT_NAME), data)
+            return True
+        except S3Error as e:
+            logger.error(f"Error uploading enrollment for user_id {user_id}: {e}")
+            return False
+    
+    def download_enrollment(self, user_id: str) -> Optional[bytes]:
+        """
+        Download a user's serialized enrollment embedding.
+        
+        Args:
+            user_id: User identifier
+            
+        Returns:
+            Serialized enrollment embedding, or None if not found
+        """
+        try:
+            return self.get_bytes(self._object_name(user_id, ENROLLMENT_ARTIFACT_NAME))
+        except S3Error as e:
+            if e.code != 'NoSuchKey':
+                logger.error(f"Error downloading enrollment for user_id {user_id}: {e}")
+            return None
+    
     def model_exists(self, user_id: str) -> bool:
         """
-        Check if a model exists in MinIO for the given user.
+        Check if a model exists in MinIO for the given user, in either artifact format.
         
         Args:
             user_id: User identifier
@@ -115,35 +230,119 @@ class MinIOClient:
         Returns:
             True if model exists, False otherwise
         """
+        return self.stat_model(user_id) is not None
+    
+    def stat_model(self, user_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Find which model artifact is stored for a user, preferring the head-only format.
+        Answers come from the local existence cache while they are fresh.
+        
+        Args:
+            user_id: User identifier
+            
+        Returns:
+            Tuple of artifact name and ETag, or None if the user has no model
+        """
+        now = time.monotonic()
+        with self._exists_lock:
+            entry = self._exists_cache.get(user_id)
+            if entry is not None and entry[1] > now:
+                self.exists_hits += 1
+                return entry[0]
+            self.exists_misses += 1
+        
+        cacheable = True
+        for artifact_name in MODEL_ARTIFACT_NAMES:
+            stat = self._stat_artifact(user_id, artifact_name)
+            if stat:
+                model = (artifact_name, stat.etag)
+                self._remember_artifact(user_id, model)
+                return model
+            if stat is None:
+                cacheable = False
+        
+        # Errors are not cached as missing, the next request asks MinIO again
+        if cacheable:
+            self._remember_artifact(user_id, None)
+        return None
+    
+    def _stat_artifact(self, user_id: str, artifact_name: str):
+        """Stat one artifact, returns False if it is missing and None on errors."""
         try:
-            object_name = f"models/{user_id}/model.weights.h5"
-            self.client.stat_object(self.bucket_name, object_name)
-            return True
+            with timed(MINIO_SECONDS, operation="stat"):
+                return self.client.stat_object(self.bucket_name, self._object_name(user_id, artifact_name))
         except S3Error as e:
             if e.code == 'NoSuchKey':
                 return False
             else:
                 logger.error(f"Error checking model existence for user_id {user_id}: {e}")
-                return False
+                return None
+    
+    def _remember_artifact(self, user_id: str, model: Optional[Tuple[str, str]]):
+        ttl = self.exists_ttl if model is not None else self.missing_ttl
+        with self._exists_lock:
+            self._exists_cache[user_id] = (model, time.monotonic() + ttl)
+            self._exists_cache.move_to_end(user_id)
+            while len(self._exists_cache) > self.exists_cache_max_entries:
+                self._exists_cache.popitem(last=False)
+    
+    def _forget_artifact(self, user_id: str):
+        with self._exists_lock:
+            self._exists_cache.pop(user_id, None)
     
-    def delete_model(self, user_id: str) -> bool:
+    def list_models(self) -> Dict[str, Set[str]]:
+        """
+        List all stored models.
+        
+        Returns:
+            Mapping of user_id to the artifact names stored for that user
+        """
+        models: Dict[str, Set[str]] = {}
+        for obj in self.client.list_objects(self.bucket_name, prefix="models/", recursive=True):
+            parts = obj.object_name.split("/")
+            if len(parts) == 3:
+                models.setdefault(parts[1], set()).add(parts[2])
+        return models
+    
+    def delete_model(self, user_id: str, artifact_names: Optional[List[str]] = None) -> bool:
         """
         Delete a model from MinIO.
         
         Args:
             user_id: User identifier
+            artifact_names: Objects to remove, defaults to every artifact format and the enrollment
             
         Returns:
             True if deletion successful, False otherwise
         """
         try:
-            object_name = f"models/{user_id}/model.weights.h5"
-            self.client.remove_object(self.bucket_name, object_name)
+            for artifact_name in artifact_names or MODEL_ARTIFACT_NAMES + [ENROLLMENT_ARTIFACT_NAME]:
+                self.client.remove_object(self.bucket_name, self._object_name(user_id, artifact_name))
             logger.info(f"Successfully deleted model for user_id: {user_id}")
-            return True
+            deleted = True
         except S3Error as e:
             logger.error(f"Error deleting model for user_id {user_id}: {e}")
-            return False
+            deleted = False
+        
+        if deleted and artifact_names is None:
+            self._remember_artifact(user_id, None)
+        else:
+            self._forget_artifact(user_id)
+        
+        return deleted
+    
+    def stats(self) -> dict:
+        """Get existence cache counters."""
+        with self._exists_lock:
+            lookups = self.exists_hits + self.exists_misses
+            return {
+                "exists_cache_entries": len(self._exists_cache),
+                "exists_ttl_seconds": self.exists_ttl,
+                "missing_ttl_seconds": self.missing_ttl,
+                "exists_hits": self.exists_hits,
+                "exists_misses": self.exists_misses,
+                "exists_hit_rate": self.exists_hits / lookups if lookups else 0.0
+            }
 
 # Global MinIO client instance
 minio_client = MinIOClient() 
\ No newline at end of file
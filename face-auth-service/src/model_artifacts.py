@@ -0,0 +1,82 @@
+import io
+import json
+import hashlib
+import logging
+from typing import List
+import numpy as np
+
+from src.backbone import BACKBONE_ID, INPUT_SHAPE, EMBEDDING_DIM
+
+logger = logging.getLogger(__name__)
+
+HEAD_FORMAT = "face-auth-head"
+HEAD_FORMAT_VERSION = 1
+
+# Names of the head tensors, in the order used by Keras get_weights/set_weights
+HEAD_TENSOR_NAMES = ["dense_kernel", "dense_bias", "output_kernel", "output_bias"]
+
+
+def _checksum(weights: List[np.ndarray]) -> str:
+    """SHA-256 over the raw bytes of the head tensors."""
+    digest = hashlib.sha256()
+    for weight in weights:
+        digest.update(np.ascontiguousarray(weight).tobytes())
+    return f"sha256:{digest.hexdigest()}"
+
+
+def serialize_head(weights: List[np.ndarray]) -> bytes:
+    """
+    Pack a user's head weights into the compact head-only artifact.
+    The artifact is an .npz with the head tensors and a JSON manifest.
+
+    Args:
+        weights: Head weights as returned by get_weights()
+
+    Returns:
+        Artifact bytes
+    """
+    if len(weights) != len(HEAD_TENSOR_NAMES):
+        raise ValueError(f"Expected {len(HEAD_TENSOR_NAMES)} head tensors, got {len(weights)}")
+
+    weights = [np.asarray(weight, dtype=np.float32) for weight in weights]
+    manifest = {
+        "format": HEAD_FORMAT,
+        "version": HEAD_FORMAT_VERSION,
+        "backbone": BACKBONE_ID,
+        "input_shape": list(INPUT_SHAPE),
+        "embedding_dim": EMBEDDING_DIM,
+        "tensors": [
+            {"name": name, "shape": list(weight.shape), "dtype": str(weight.dtype)}
+            for name, weight in zip(HEAD_TENSOR_NAMES, weights)
+        ],
+        "checksum": _checksum(weights)
+    }
+
+    buffer = io.BytesIO()
+    np.savez(buffer, manifest=np.array(json.dumps(manifest)), **dict(zip(HEAD_TENSOR_NAMES, weights)))
+    return buffer.getvalue()
+
+
+def deserialize_head(data: bytes) -> List[np.ndarray]:
+    """
+    Unpack and validate a head-only artifact.
+
+    Args:
+        data: Artifact bytes
+
+    Returns:
+        Head weights in set_weights() order
+    """
+    with np.load(io.BytesIO(data)) as artifact:
+        manifest = json.loads(str(artifact["manifest"]))
+        weights = [artifact[name] for name in HEAD_TENSOR_NAMES]
+
+    if manifest.get("format") != HEAD_FORMAT or manifest.get("version") != HEAD_FORMAT_VERSION:
+        raise ValueError(f"Unsupported head artifact format: {manifest.get('format')} v{manifest.get('version')}")
+    if manifest.get("backbone") != BACKBONE_ID or tuple(manifest.get("input_shape", [])) != INPUT_SHAPE:
+        raise ValueError(f"Head artifact was trained for {manifest.get('backbone')} "
+                         f"with input shape {manifest.get('input_shape')}")
+    if manifest.get("checksum") != _checksum(weights):
+        raise ValueError("Head artifact checksum mismatch")
+
+    return weights
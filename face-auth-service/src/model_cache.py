@@ -0,0 +1,134 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def _model_nbytes(model: Any) -> int:
+    """Approximate memory held by a model's weights, in bytes."""
+    return sum(int(weight.nbytes) for weight in model.get_weights())
+
+
+class ModelCache:
+    def __init__(self):
+        """Initialize the per-user model cache with limits from environment variables."""
+        self.max_entries = int(os.getenv('MODEL_CACHE_MAX_ENTRIES', '1000'))
+        self.max_bytes = int(os.getenv('MODEL_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # user_id -> (model, nbytes)
+        self._inflight: Dict[str, Future] = {}
+        self._stale_loads: set = set()  # user_ids invalidated while loading
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, user_id: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Get a user's model from the cache, loading it on a miss.
+        Concurrent misses for the same user share a single call to the loader.
+
+        Args:
+            user_id: User identifier
+            loader: Function loading the model for a user_id
+
+        Returns:
+            The cached or freshly loaded model
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+
+            future = self._inflight.get(user_id)
+            if future is not None:
+                self.coalesced += 1
+                is_owner = False
+            else:
+                self.misses += 1
+                future = Future()
+                self._inflight[user_id] = future
+                is_owner = True
+
+        if not is_owner:
+            return future.result()
+
+        # Whatever happens below, waiters must get an answer and later calls must not find a stale in-flight entry
+        try:
+            model = loader(user_id)
+            nbytes = _model_nbytes(model)
+            with self._lock:
+                # Don't cache a model that was invalidated while it was loading
+                if user_id not in self._stale_loads:
+                    self._store(user_id, model, nbytes)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(model)
+            return model
+        finally:
+            with self._lock:
+                self._inflight.pop(user_id, None)
+                self._stale_loads.discard(user_id)
+
+    def _store(self, user_id: str, model: Any, nbytes: int):
+        """Insert a model and evict least recently used entries over budget. Caller holds the lock."""
+        if nbytes > self.max_bytes:
+            logger.warning(f"Model for user_id {user_id} ({nbytes} bytes) exceeds cache budget, not caching")
+            return
+
+        self._entries[user_id] = (model, nbytes)
+        self._bytes += nbytes
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            evicted_user_id, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self._bytes -= evicted_bytes
+            self.evictions += 1
+            logger.debug(f"Evicted cached model for user_id: {evicted_user_id}")
+
+    def invalidate(self, user_id: str):
+        """
+        Drop a user's cached model, e.g. after it was retrained or deleted.
+
+        Args:
+            user_id: User identifier
+        """
+        with self._lock:
+            if user_id in self._inflight:
+                self._stale_loads.add(user_id)
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+                self.invalidations += 1
+                logger.info(f"Invalidated cached model for user_id: {user_id}")
+
+    def stats(self) -> dict:
+        """Get cache counters for sizing the cache against login traffic."""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0
+            }
+
+# Global model cache instance
+model_cache = ModelCache()
@@ -0,0 +1,212 @@
+import os
+import re
+import base64
+import binascii
+import shutil
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from src.user_data import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+
+# Prefix of user directories, directories of the old sanitized-name layout are left to eviction
+USER_DIR_PREFIX = "u-"
+
+
+def _safe_name(value: str) -> str:
+    """Keep only characters that are safe in a file name."""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", value.strip('"'))
+
+
+def _user_dir_name(user_id: str) -> str:
+    """Encode a user_id as a directory name, reversibly so distinct users never share one."""
+    return USER_DIR_PREFIX + base64.urlsafe_b64encode(user_id.encode()).decode().rstrip("=")
+
+
+def _user_id_from_dir(name: str) -> Optional[str]:
+    """Decode a directory name from _user_dir_name, or None if it is not one."""
+    if not name.startswith(USER_DIR_PREFIX):
+        return None
+    encoded = name[len(USER_DIR_PREFIX):]
+    try:
+        return base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class DiskModelCache:
+    def __init__(self):
+        """
+        Initialize the local model artifact cache with settings from environment variables.
+        Files are stored as {encoded user_id}/{etag}-{artifact_name}, so a changed object never matches
+        an old file. Recency is the file mtime, which is shared by every worker process.
+        """
+        self.enabled = os.getenv('MODEL_DISK_CACHE_ENABLED', 'true').lower() == 'true'
+        self.root = Path(os.getenv('MODEL_DISK_CACHE_DIR', str(DATA_DIR / 'model-cache')))
+        self.max_bytes = int(os.getenv('MODEL_DISK_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _path(self, user_id: str, artifact_name: str, etag: str) -> Path:
+        return self.root / _user_dir_name(user_id) / f"{_safe_name(etag)}-{artifact_name}"
+
+    def _files(self) -> List[Path]:
+        return [path for path in self.root.glob("*/*") if path.is_file() and not path.name.startswith(".tmp")]
+
+    def get(self, user_id: str, artifact_name: str, etag: str) -> Optional[bytes]:
+        """
+        Read a cached artifact.
+
+        Args:
+            user_id: User identifier
+            artifact_name: Artifact name in MinIO
+            etag: ETag of the current MinIO object
+
+        Returns:
+            Artifact bytes, or None if this version is not cached
+        """
+        if not self.enabled:
+            return None
+
+        path = self._path(user_id, artifact_name, etag)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, user_id: str, artifact_name: str, etag: str, data: bytes):
+        """
+        Store an artifact, replacing older versions for the user.
+        The file is written under a temporary name and renamed, so readers never see a partial file.
+
+        Args:
+            user_id: User identifier
+            artifact_name: Artifact name in MinIO
+            etag: ETag of the MinIO object the data was read from
+            data: Artifact bytes
+        """
+        if not self.enabled:
+            return
+
+        path = self._path(user_id, artifact_name, etag)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix=".tmp", dir=path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+            # Older versions of the user's model are never read again
+            removed = 0
+            for old_path in path.parent.iterdir():
+                if old_path != path and not old_path.name.startswith(".tmp"):
+                    try:
+                        size = old_path.stat().st_size
+                        old_path.unlink()
+                        removed += size
+                    except FileNotFoundError:
+                        pass
+
+        except OSError as e:
+            logger.warning(f"Could not write model cache file for user_id {user_id}: {e}")
+            return
+
+        with self._lock:
+            self.writes += 1
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - removed
+            over_limit = self._total_bytes is None or self._total_bytes > self.max_bytes
+
+        if over_limit:
+            self._enforce_limit()
+
+    def _enforce_limit(self):
+        """Remove least recently used files until the cache fits in max_bytes."""
+        with self._lock:
+            files = []
+            for path in self._files():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    path.parent.rmdir()
+                except OSError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+            self._total_bytes = total
+
+    def invalidate(self, user_id: str):
+        """Remove every cached artifact of a user."""
+        shutil.rmtree(self.root / _user_dir_name(user_id), ignore_errors=True)
+        with self._lock:
+            self._total_bytes = None
+
+    def recent_user_ids(self, limit: int) -> List[str]:
+        """
+        Get the users whose models were used most recently, e.g. to preload them after a restart.
+
+        Args:
+            limit: Maximum number of user_ids
+
+        Returns:
+            user_ids, most recently used first
+        """
+        if not self.enabled or not self.root.exists():
+            return []
+
+        latest = {}
+        for path in self._files():
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            user_id = _user_id_from_dir(path.parent.name)
+            if user_id is not None:
+                latest[user_id] = max(latest.get(user_id, 0.0), mtime)
+
+        return sorted(latest, key=latest.get, reverse=True)[:limit]
+
+    def stats(self) -> dict:
+        """Get disk cache counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+# Global disk model cache instance
+model_disk_cache = DiskModelCache()
@@ -0,0 +1,147 @@
+import os
+import random
+import logging
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Optional
+
+from src.backbone import extract_embeddings, BACKBONE_ID, EMBEDDING_DIM
+from src.preprocess_pool import preprocess_pool
+from src.user_data import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+FALSE_FACES_PATH = DATA_DIR / "false-faces"
+NEGATIVE_BANK_PATH = Path(os.getenv('NEGATIVE_BANK_PATH', str(DATA_DIR / 'negative_bank.npz')))
+
+_bank: Optional[np.ndarray] = None
+_bank_mtime: Optional[float] = None
+_bank_lock = threading.Lock()
+
+
+def embed_negative_files(image_paths: List[Path], batch_size: int = 32, chunk_size: int = 512) -> np.ndarray:
+    """
+    Detect, crop and embed negative face images with the shared backbone.
+    Cropping is fanned out over the preprocessing pool, one chunk of files at a time.
+    Negative samples might already be face crops, so images without a face are resized as a whole.
+
+    Args:
+        image_paths: Paths of the negative images
+        batch_size: Number of images run through the backbone at once
+        chunk_size: Number of images cropped in parallel before embedding them
+
+    Returns:
+        float32 embeddings with shape (N, EMBEDDING_DIM), unreadable images are skipped
+    """
+    embeddings = []
+
+    for start in range(0, len(image_paths), chunk_size):
+        chunk = image_paths[start:start + chunk_size]
+        crops = [crop for crop in preprocess_pool.map(chunk, fallback=True) if crop is not None]
+
+        for batch_start in range(0, len(crops), batch_size):
+            batch = np.stack(crops[batch_start:batch_start + batch_size]).astype(np.float32) / 255.0
+            embeddings.append(extract_embeddings(batch))
+
+        logger.info(f"Embedded {min(start + chunk_size, len(image_paths))}/{len(image_paths)} negative images")
+
+    if not embeddings:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    return np.concatenate(embeddings).astype(np.float32)
+
+
+def build_negative_bank(false_faces_path: Path = FALSE_FACES_PATH, output_path: Path = NEGATIVE_BANK_PATH) -> int:
+    """
+    Embed the whole false-faces pool once and persist it as the negative bank.
+
+    Args:
+        false_faces_path: Directory with the negative face images
+        output_path: Where to write the .npz bank
+
+    Returns:
+        Number of embeddings stored in the bank
+    """
+    image_paths = sorted(path for path in false_faces_path.glob("*") if path.is_file())
+    logger.info(f"Building negative bank from {len(image_paths)} images in {false_faces_path}")
+
+    embeddings = embed_negative_files(image_paths)
+
+    # Write to a temporary file first so a crash never leaves a partial bank behind
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(output_path.name + ".tmp.npz")
+    np.savez(
+        temp_path,
+        embeddings=embeddings.astype(np.float16),
+        backbone=np.array(BACKBONE_ID)
+    )
+    os.replace(temp_path, output_path)
+
+    logger.info(f"✅ Negative bank with {len(embeddings)} embeddings saved to {output_path}")
+    return len(embeddings)
+
+
+def load_negative_bank() -> Optional[np.ndarray]:
+    """
+    Load the negative bank once per process, and again when it is rebuilt.
+    The bank is built in the background at startup, so it may appear after the service started.
+
+    Returns:
+        float16 embeddings with shape (N, EMBEDDING_DIM), or None if no valid bank was built
+    """
+    global _bank, _bank_mtime
+
+    try:
+        mtime = NEGATIVE_BANK_PATH.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+    if mtime != _bank_mtime:
+        with _bank_lock:
+            if mtime != _bank_mtime:
+                with np.load(NEGATIVE_BANK_PATH) as data:
+                    embeddings = data["embeddings"]
+                    backbone = str(data["backbone"])
+
+                _bank_mtime = mtime
+                if backbone != BACKBONE_ID or embeddings.ndim != 2 or embeddings.shape[1] != EMBEDDING_DIM:
+                    logger.warning(f"Ignoring negative bank built for {backbone} with shape {embeddings.shape}")
+                    _bank = None
+                else:
+                    _bank = embeddings
+                    logger.info(f"Loaded negative bank with {len(_bank)} embeddings")
+
+    return _bank
+
+
+def sample_negative_embeddings(count: int) -> np.ndarray:
+    """
+    Sample negative embeddings for a registration.
+    Uses the precomputed bank, or embeds a sample of false-faces on the fly if there is none.
+
+    Args:
+        count: Number of negatives wanted
+
+    Returns:
+        float32 embeddings with shape (<=count, EMBEDDING_DIM)
+    """
+    bank = load_negative_bank()
+
+    if bank is not None:
+        rows = random.sample(range(len(bank)), min(count, len(bank)))
+        return bank[rows].astype(np.float32)
+
+    logger.warning(f"No negative bank at {NEGATIVE_BANK_PATH}, embedding false-faces on the fly. "
+                   f"Run 'python -m src.negative_bank' to build it.")
+    all_negatives = list(FALSE_FACES_PATH.glob("*"))
+    selected_negatives = random.sample(all_negatives, min(count, len(all_negatives)))
+    return embed_negative_files(selected_negatives)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        build_negative_bank()
+    finally:
+        preprocess_pool.shutdown()
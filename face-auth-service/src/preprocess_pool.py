@@ -0,0 +1,187 @@
+import os
+import logging
+import threading
+import functools
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+# Only TensorFlow-free modules are imported here, worker processes load this module on start
+from src.face_detection import decode_and_crop_face, get_detector_pool
+from src.metrics import capture_stage_timings, observe_stage_timings
+
+logger = logging.getLogger(__name__)
+
+ImageSource = Union[bytes, str, Path]
+
+
+def _init_worker():
+    """Warm up this worker's own detector so its first image doesn't pay for it."""
+    with get_detector_pool().acquire():
+        pass
+
+
+def preprocess_face(source: ImageSource, fallback: bool = False,
+                    target_size: Tuple[int, int] = (224, 224)) -> Optional[np.ndarray]:
+    """
+    Decode an image, detect the face and crop it to the model input size.
+
+    Args:
+        source: Raw image bytes or path to an image file
+        fallback: Resize the whole image when no face is found instead of returning None
+        target_size: Target size for the crop (width, height)
+
+    Returns:
+        RGB face crop as uint8, or None if the image is unreadable or (without fallback) has no face
+    """
+    try:
+        image_bytes = Path(source).read_bytes() if isinstance(source, (str, Path)) else source
+        return decode_and_crop_face(image_bytes, target_size=target_size, fallback=fallback)
+
+    except ValueError:
+        logger.warning(f"Could not decode image: {source if isinstance(source, (str, Path)) else '<bytes>'}")
+        return None
+    except Exception as e:
+        logger.error(f"Error preprocessing image: {e}")
+        return None
+
+
+def _preprocess_in_worker(source: ImageSource, fallback: bool = False) -> Tuple[Optional[np.ndarray], List[Tuple[str, float]]]:
+    """preprocess_face run in a worker process, returning its stage timings for the service's /metrics."""
+    with capture_stage_timings() as stage_timings:
+        face_crop = preprocess_face(source, fallback)
+    return face_crop, stage_timings
+
+
+def _unpack_worker_result(result: Tuple[Optional[np.ndarray], List[Tuple[str, float]]]) -> Optional[np.ndarray]:
+    face_crop, stage_timings = result
+    observe_stage_timings(stage_timings)
+    return face_crop
+
+
+class PreprocessPool:
+    def __init__(self):
+        """Initialize the preprocessing process pool with its size from environment variables."""
+        self.max_workers = int(os.getenv('PREPROCESS_WORKERS', str(os.cpu_count() or 1)))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start the worker processes on first use."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn instead of fork, forking a process that already runs TensorFlow threads can deadlock
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker
+                    )
+                    logger.info(f"Started preprocessing pool with {self.max_workers} worker processes")
+        return self._executor
+
+    def _reset_broken(self, executor: ProcessPoolExecutor):
+        """Drop a broken executor so the next call starts new worker processes."""
+        with self._lock:
+            if self._executor is not executor:
+                # Another call already replaced it
+                return
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.error("Preprocessing pool broke (a worker died), it will be restarted on next use")
+
+    def _forward_result(self, executor: ProcessPoolExecutor, result: Future, future: Future):
+        """
+        Done callback of a worker future: record its stage timings and pass the face crop on to result.
+        Resets the pool when a worker died while running it.
+        """
+        if future.cancelled():
+            result.cancel()
+            return
+
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._reset_broken(executor)
+        face_crop = _unpack_worker_result(future.result()) if error is None else None
+
+        # The caller may have cancelled result while the worker was already running
+        if result.set_running_or_notify_cancel():
+            if error is None:
+                result.set_result(face_crop)
+            else:
+                result.set_exception(error)
+
+    def submit(self, source: ImageSource, fallback: bool = False) -> Future:
+        """
+        Preprocess one image in a worker process, or on the cpu thread pool when
+        there is at most one worker, so the caller's event loop is never blocked.
+
+        Args:
+            source: Raw image bytes or path to an image file
+            fallback: See preprocess_face
+
+        Returns:
+            Future resolving to the face crop or None
+        """
+        if self.max_workers <= 1:
+            from src.executors import cpu_executor
+            return cpu_executor.submit(preprocess_face, source, fallback)
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_preprocess_in_worker, source, fallback)
+        except BrokenProcessPool:
+            self._reset_broken(executor)
+            raise
+
+        # Cancelling the returned future drops the work if no worker has picked it up yet
+        result = Future()
+        result.add_done_callback(lambda result: result.cancelled() and future.cancel())
+        future.add_done_callback(functools.partial(self._forward_result, executor, result))
+        return result
+
+    def map(self, sources: Sequence[ImageSource], fallback: bool = False) -> List[Optional[np.ndarray]]:
+        """
+        Preprocess many images across the worker processes.
+
+        Args:
+            sources: Raw image bytes or paths to image files
+            fallback: See preprocess_face
+
+        Returns:
+            Face crops (or None) in the same order as sources
+        """
+        if self.max_workers <= 1 or len(sources) <= 1:
+            return [preprocess_face(source, fallback) for source in sources]
+
+        chunksize = max(1, len(sources) // (self.max_workers * 4))
+        executor = self._get_executor()
+        try:
+            return [_unpack_worker_result(result) for result in executor.map(
+                functools.partial(_preprocess_in_worker, fallback=fallback),
+                sources,
+                chunksize=chunksize
+            )]
+        except BrokenProcessPool:
+            self._reset_broken(executor)
+            raise
+
+    def warm_up(self):
+        """Start all worker processes and their detectors up front."""
+        if self.max_workers > 1:
+            executor = self._get_executor()
+            for future in [executor.submit(os.getpid) for _ in range(self.max_workers)]:
+                future.result()
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+# Global preprocessing pool instance
+preprocess_pool = PreprocessPool()
@@ -0,0 +1,305 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncContextManager, AsyncIterator, ContextManager, Dict, Iterator, List, Optional
+
+from src.user_data import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Code paths a TensorFlow trace can be armed for
+TRACE_TARGETS = ("verify", "train")
+
+
+class Profiler:
+    def __init__(self):
+        """
+        Opt-in, on-demand profiling of the running worker with settings from environment variables.
+        Nothing runs until a profile is requested: the stack sampler is a thread started per
+        capture, and the trace hooks only compare one attribute while no trace is armed.
+        """
+        self.enabled = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+        self.output_dir = Path(os.getenv('PROFILING_DIR', str(DATA_DIR / 'profiles')))
+        self.max_seconds = float(os.getenv('PROFILING_MAX_SECONDS', '60'))
+        self.max_trace_calls = int(os.getenv('PROFILING_MAX_TRACE_CALLS', '100'))
+        self.sample_interval = float(os.getenv('PROFILING_SAMPLE_INTERVAL_MS', '5')) / 1000.0
+
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._sampling_artifact: Optional[str] = None
+
+        # Armed TensorFlow trace: target, calls left to start, calls in flight. The lock only guards
+        # these counters, starting, stopping and archiving the trace happen outside of it
+        self._trace_target: Optional[str] = None
+        self._trace_remaining = 0
+        self._trace_active = 0
+        self._trace_starting = False
+        self._trace_started = False
+        self._trace_writing = False
+        self._trace_dir: Optional[Path] = None
+
+    def _artifact_name(self, kind: str) -> str:
+        return f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+    def sample_stacks(self, seconds: float) -> str:
+        """
+        Sample the Python stacks of every thread for a while in a background thread.
+        The result is written in the collapsed stack format read by flamegraph.pl and speedscope.
+
+        Args:
+            seconds: Capture duration, at most PROFILING_MAX_SECONDS
+
+        Returns:
+            Name of the artifact that is written when the capture ends
+
+        Raises:
+            ValueError: If seconds is out of range
+            RuntimeError: If a capture is already running
+        """
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"seconds must be between 0 and {self.max_seconds}")
+
+        with self._lock:
+            if self._sampler is not None:
+                raise RuntimeError("A stack capture is already running")
+            artifact = f"{self._artifact_name('stacks')}.txt"
+            self._sampling_artifact = artifact
+            self._sampler = threading.Thread(target=self._sample, args=(seconds, artifact), name="stack-sampler", daemon=True)
+            self._sampler.start()
+
+        logger.info(f"Sampling stacks for {seconds:.0f}s into {artifact}")
+        return artifact
+
+    def _sample(self, seconds: float, artifact: str):
+        own_thread_id = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        try:
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    stack.append(thread_names.get(thread_id, str(thread_id)))
+                    stacks[";".join(reversed(stack))] += 1
+                samples += 1
+                time.sleep(self.sample_interval)
+
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = self.output_dir / f".tmp-{artifact}"
+            with open(temp_path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            os.replace(temp_path, self.output_dir / artifact)
+            logger.info(f"Stack capture {artifact} written ({samples} samples)")
+
+        except Exception as e:
+            logger.error(f"Stack capture {artifact} failed: {e}")
+        finally:
+            with self._lock:
+                self._sampler = None
+                self._sampling_artifact = None
+
+    def arm_trace(self, target: str, count: int = 1) -> str:
+        """
+        Record a TensorFlow profiler trace around the next calls of a code path.
+
+        Args:
+            target: verify (the next count /verify calls) or train (the next training run)
+            count: Number of calls to trace, training is always traced once
+
+        Returns:
+            Name of the .zip artifact that is written when the last traced call ends
+
+        Raises:
+            ValueError: If target or count is invalid
+            RuntimeError: If a trace is already armed or running
+        """
+        if target not in TRACE_TARGETS:
+            raise ValueError(f"target must be one of {', '.join(TRACE_TARGETS)}")
+        if target == "train":
+            count = 1
+        if not 0 < count <= self.max_trace_calls:
+            raise ValueError(f"count must be between 1 and {self.max_trace_calls}")
+
+        with self._lock:
+            if self._trace_target is not None:
+                raise RuntimeError(f"A trace for {self._trace_target} is already armed")
+            if self._trace_writing:
+                raise RuntimeError("The previous trace is still being written")
+            self._trace_dir = self.output_dir / self._artifact_name(f"trace-{target}")
+            self._trace_remaining = count
+            self._trace_target = target
+
+        logger.info(f"TensorFlow trace armed for the next {count} {target} call(s)")
+        return f"{self._trace_dir.name}.zip"
+
+    def traced(self, target: str) -> ContextManager:
+        """
+        Wrap a call of a code path that can be traced, from a worker thread.
+
+        Args:
+            target: Code path name, see TRACE_TARGETS
+
+        Returns:
+            Context manager tracing the call if a trace is armed for target, a no-op otherwise
+        """
+        if self._trace_target != target:
+            return nullcontext()
+        return self._trace(target)
+
+    def traced_async(self, target: str) -> AsyncContextManager:
+        """
+        Wrap a call of a code path that can be traced, from an async handler.
+        The profiler is started on the io pool, so the event loop never waits for it.
+
+        Args:
+            target: Code path name, see TRACE_TARGETS
+
+        Returns:
+            Async context manager tracing the call if a trace is armed for target, a no-op otherwise
+        """
+        if self._trace_target != target:
+            return nullcontext()
+        return self._trace_async(target)
+
+    @contextmanager
+    def _trace(self, target: str) -> Iterator[None]:
+        claim = self._claim_trace(target)
+        if claim == "start":
+            claim = "traced" if self._start_trace() else "skip"
+        try:
+            yield
+        finally:
+            if claim == "traced":
+                self._leave_trace()
+
+    @asynccontextmanager
+    async def _trace_async(self, target: str) -> AsyncIterator[None]:
+        claim = self._claim_trace(target)
+        if claim == "start":
+            from src.executors import io_executor
+            claim = "traced" if await io_executor.run(self._start_trace) else "skip"
+        try:
+            yield
+        finally:
+            if claim == "traced":
+                self._leave_trace()
+
+    def _claim_trace(self, target: str) -> str:
+        """
+        Count a call into the armed trace.
+
+        Returns:
+            traced if the call is part of the running trace, start if the caller has to start
+            the profiler first (see _start_trace), skip if the call is not traced
+        """
+        with self._lock:
+            if self._trace_target != target or self._trace_remaining == 0 or self._trace_starting:
+                # Calls arriving while the profiler is starting are not traced
+                return "skip"
+            if not self._trace_started:
+                self._trace_starting = True
+                return "start"
+            self._trace_remaining -= 1
+            self._trace_active += 1
+            return "traced"
+
+    def _start_trace(self) -> bool:
+        """Start the profiler for the call that claimed it, or disarm the trace if it cannot start."""
+        try:
+            import tensorflow as tf
+            tf.profiler.experimental.start(str(self._trace_dir))
+            started = True
+        except Exception as e:
+            # Profiling must never fail the request it wraps
+            logger.error(f"Could not start TensorFlow trace: {e}")
+            started = False
+
+        with self._lock:
+            self._trace_starting = False
+            if started:
+                self._trace_started = True
+                self._trace_remaining -= 1
+                self._trace_active += 1
+            else:
+                self._trace_target = None
+                self._trace_dir = None
+        return started
+
+    def _leave_trace(self):
+        """End a traced call, the last one hands the trace to a background writer."""
+        with self._lock:
+            self._trace_active -= 1
+            if self._trace_remaining > 0 or self._trace_active > 0:
+                return
+            trace_dir = self._trace_dir
+            self._trace_target = None
+            self._trace_dir = None
+            self._trace_started = False
+            self._trace_writing = True
+
+        threading.Thread(target=self._finish_trace, args=(trace_dir,), name="trace-writer", daemon=True).start()
+
+    def _finish_trace(self, trace_dir: Path):
+        """Stop the profiler and pack the trace directory for download."""
+        try:
+            import tensorflow as tf
+            tf.profiler.experimental.stop()
+            shutil.make_archive(str(trace_dir), "zip", root_dir=trace_dir)
+            shutil.rmtree(trace_dir, ignore_errors=True)
+            logger.info(f"TensorFlow trace {trace_dir.name}.zip written")
+        except Exception as e:
+            logger.error(f"TensorFlow trace {trace_dir.name} failed: {e}")
+        finally:
+            with self._lock:
+                self._trace_writing = False
+
+    def artifacts(self) -> List[Dict]:
+        """List the written profile artifacts, newest first."""
+        if not self.output_dir.exists():
+            return []
+        paths = [path for path in self.output_dir.iterdir() if path.is_file() and not path.name.startswith(".tmp")]
+        paths.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+        return [{"name": path.name, "bytes": path.stat().st_size} for path in paths]
+
+    def artifact_path(self, name: str) -> Optional[Path]:
+        """
+        Resolve a listed artifact name to its file.
+
+        Args:
+            name: Artifact name from artifacts()
+
+        Returns:
+            Path of the artifact, or None if there is no such artifact
+        """
+        if name not in {artifact["name"] for artifact in self.artifacts()}:
+            return None
+        return self.output_dir / name
+
+    def stats(self) -> dict:
+        """Get the running captures."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sampling": self._sampling_artifact,
+                "trace_target": self._trace_target,
+                "trace_remaining": self._trace_remaining if self._trace_target else 0,
+                "trace_writing": self._trace_writing
+            }
+
+# Global profiler instance
+profiler = Profiler()
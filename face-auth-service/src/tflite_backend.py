@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.backbone import get_backbone, extract_embeddings, BACKBONE_ID, INPUT_SHAPE
+from src.user_data import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+TFLITE_MODEL_PATH = Path(os.getenv('TFLITE_MODEL_PATH', str(DATA_DIR / 'backbone_int8.tflite')))
+TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', str(os.cpu_count() or 1)))
+TFLITE_CALIBRATION_SAMPLES = int(os.getenv('TFLITE_CALIBRATION_SAMPLES', '200'))
+TFLITE_RELOAD_CHECK_SECONDS = float(os.getenv('TFLITE_RELOAD_CHECK_SECONDS', '30'))
+
+# Decision threshold used to count verifications the quantized model would flip
+DRIFT_THRESHOLD = 0.5
+
+
+def _metadata_path(model_path: Path) -> Path:
+    return model_path.with_name(model_path.name + ".json")
+
+
+def _write_atomic(path: Path, data: bytes):
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+def sample_false_faces(count: int) -> np.ndarray:
+    """
+    Crop a random sample of the false-faces pool.
+
+    Args:
+        count: Number of images wanted
+
+    Returns:
+        float32 faces with shape (<=count, 224, 224, 3), normalized to [0,1]
+    """
+    from src.negative_bank import FALSE_FACES_PATH
+    from src.preprocess_pool import preprocess_pool
+
+    paths = [path for path in FALSE_FACES_PATH.glob("*") if path.is_file()]
+    paths = random.sample(paths, min(count, len(paths)))
+    crops = [crop for crop in preprocess_pool.map(paths, fallback=True) if crop is not None]
+
+    if not crops:
+        return np.zeros((0,) + INPUT_SHAPE, dtype=np.float32)
+
+    return np.stack(crops).astype(np.float32) / 255.0
+
+
+def convert_backbone(calibration_faces: np.ndarray) -> bytes:
+    """
+    Convert the shared backbone to an int8 TFLite model.
+    Activation ranges are calibrated on calibration_faces, input and output stay float32.
+
+    Args:
+        calibration_faces: Representative faces, normalized to [0,1]
+
+    Returns:
+        TFLite flatbuffer
+    """
+    export_dir = tempfile.mkdtemp()
+    try:
+        get_backbone().export(export_dir)
+
+        converter = tf.lite.TFLiteConverter.from_saved_model(export_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([face[np.newaxis]] for face in calibration_faces)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        return converter.convert()
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+
+
+class QuantizedBackbone:
+    def __init__(self, model_path: Path = TFLITE_MODEL_PATH, num_threads: int = TFLITE_NUM_THREADS):
+        """
+        Int8 TFLite version of the shared backbone, loaded lazily from model_path.
+        A TFLite interpreter is not thread-safe, so calls are serialized.
+        There is one interpreter per power-of-two batch size and batches are zero-padded up to it,
+        so micro-batches of varying size do not re-allocate tensors on every call.
+
+        Args:
+            model_path: Path of the .tflite model written by build_quantized_backbone
+            num_threads: Threads used by the interpreter
+        """
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.metadata: Optional[dict] = None
+
+        self._interpreters: Dict[int, tf.lite.Interpreter] = {}
+        self._metadata_mtime: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        self._missing_logged = False
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+
+    def _load(self) -> bool:
+        """
+        Load the model on first use, and again when the model is rebuilt. Caller holds the lock.
+        The model is built in the background at startup, so it may appear after the service started.
+        The metadata file is checked at most every TFLITE_RELOAD_CHECK_SECONDS.
+        """
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < TFLITE_RELOAD_CHECK_SECONDS:
+            return self.metadata is not None
+        self._checked_at = now
+
+        metadata_path = _metadata_path(self.model_path)
+        try:
+            mtime = metadata_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime is None or not self.model_path.exists():
+            if not self._missing_logged:
+                logger.warning(f"No quantized backbone at {self.model_path}, falling back to the float backbone. "
+                               f"Run 'python -m src.tflite_backend' to build it.")
+                self._missing_logged = True
+            self._metadata_mtime = None
+            self._interpreters = {}
+            self.metadata = None
+            return False
+
+        if mtime != self._metadata_mtime:
+            self._metadata_mtime = mtime
+            self._interpreters = {}
+            self.metadata = None
+
+            metadata = json.loads(metadata_path.read_text())
+            if metadata.get("backbone") != BACKBONE_ID or tuple(metadata.get("input_shape", [])) != INPUT_SHAPE:
+                logger.warning(f"Ignoring quantized backbone built for {metadata.get('backbone')}, "
+                               f"falling back to the float backbone")
+                return False
+
+            self._interpreter(1)
+            self.metadata = metadata
+            logger.info(f"✅ Quantized backbone loaded from {self.model_path} ({self.num_threads} threads)")
+
+        return self.metadata is not None
+
+    def _interpreter(self, batch_size: int) -> tf.lite.Interpreter:
+        """Get the interpreter allocated for batch_size, creating it on first use. Caller holds the lock."""
+        interpreter = self._interpreters.get(batch_size)
+        if interpreter is None:
+            interpreter = tf.lite.Interpreter(model_path=str(self.model_path), num_threads=self.num_threads)
+            interpreter.resize_tensor_input(interpreter.get_input_details()[0]["index"],
+                                            [batch_size] + list(INPUT_SHAPE))
+            interpreter.allocate_tensors()
+            self._interpreters[batch_size] = interpreter
+        return interpreter
+
+    def available(self) -> bool:
+        """Whether a valid quantized model could be loaded."""
+        with self._lock:
+            return self._load()
+
+    def embed(self, images: np.ndarray) -> np.ndarray:
+        """
+        Run a batch of preprocessed face images through the quantized backbone.
+
+        Args:
+            images: Batch of images with shape (N, 224, 224, 3), normalized to [0,1]
+
+        Returns:
+            Embeddings with shape (N, EMBEDDING_DIM)
+        """
+        with self._lock:
+            if not self._load():
+                raise RuntimeError(f"No quantized backbone available at {self.model_path}")
+
+            started_at = time.perf_counter()
+
+            # Pad up to the next power of two so only a handful of interpreters are ever allocated
+            count = len(images)
+            batch_size = 1 << max(0, count - 1).bit_length()
+            batch = np.zeros((batch_size,) + INPUT_SHAPE, dtype=np.float32)
+            batch[:count] = images
+
+            interpreter = self._interpreter(batch_size)
+            interpreter.set_tensor(interpreter.get_input_details()[0]["index"], batch)
+            interpreter.invoke()
+            embeddings = interpreter.get_tensor(interpreter.get_output_details()[0]["index"])[:count].copy()
+
+            self.calls += 1
+            self.items += len(images)
+            self.seconds += time.perf_counter() - started_at
+
+            return embeddings
+
+    def stats(self) -> dict:
+        """Get the model state, call latency and the drift measured when it was built."""
+        with self._lock:
+            return {
+                "model_path": str(self.model_path),
+                "loaded": self.metadata is not None,
+                "batch_sizes": sorted(self._interpreters),
+                "calls": self.calls,
+                "items": self.items,
+                "avg_call_ms": 1000.0 * self.seconds / self.calls if self.calls else 0.0,
+                "drift": (self.metadata or {}).get("drift")
+            }
+
+
+def _embed_in_batches(embed, faces: np.ndarray, batch_size: int = 32) -> np.ndarray:
+    return np.concatenate([embed(faces[start:start + batch_size]) for start in range(0, len(faces), batch_size)])
+
+
+def drift_report(quantized: QuantizedBackbone, faces: np.ndarray, heads: Dict[str, tf.keras.Model]) -> dict:
+    """
+    Compare the quantized backbone against the float one.
+
+    Args:
+        quantized: Quantized backbone to check
+        faces: Held-out faces (not used for calibration), normalized to [0,1]
+        heads: User heads to compare REAL scores with, keyed by user_id
+
+    Returns:
+        Dict with embedding cosine similarity and, if heads were given, score drift
+    """
+    float_embeddings = _embed_in_batches(extract_embeddings, faces)
+    quantized_embeddings = _embed_in_batches(quantized.embed, faces)
+
+    cosine = np.sum(float_embeddings * quantized_embeddings, axis=1) / (
+        np.linalg.norm(float_embeddings, axis=1) * np.linalg.norm(quantized_embeddings, axis=1) + 1e-12
+    )
+    report = {
+        "samples": len(faces),
+        "embedding_cosine_mean": float(np.mean(cosine)),
+        "embedding_cosine_min": float(np.min(cosine)),
+        "users": len(heads)
+    }
+
+    if heads:
+        differences = []
+        flips = 0
+        for head in heads.values():
+            float_scores = np.asarray(head(float_embeddings, training=False)).reshape(-1)
+            quantized_scores = np.asarray(head(quantized_embeddings, training=False)).reshape(-1)
+            differences.append(np.abs(float_scores - quantized_scores))
+            flips += int(np.sum((float_scores >= DRIFT_THRESHOLD) != (quantized_scores >= DRIFT_THRESHOLD)))
+
+        differences = np.concatenate(differences)
+        report.update({
+            "score_abs_diff_mean": float(np.mean(differences)),
+            "score_abs_diff_p95": float(np.percentile(differences, 95)),
+            "score_abs_diff_max": float(np.max(differences)),
+            "decision_flips": flips,
+            "decision_flip_rate": flips / len(differences)
+        })
+
+    return report
+
+
+def load_drift_heads(max_users: int) -> Dict[str, tf.keras.Model]:
+    """Load a random sample of stored user heads to measure score drift with."""
+    from src.minio_client import minio_client
+    from src.train import load_trained_model
+
+    user_ids = list(minio_client.list_models())
+    heads = {}
+    for user_id in random.sample(user_ids, min(max_users, len(user_ids))):
+        try:
+            heads[user_id] = load_trained_model(user_id)
+        except Exception as e:
+            logger.warning(f"Skipping user_id {user_id} in drift report: {e}")
+    return heads
+
+
+def build_quantized_backbone(model_path: Path = TFLITE_MODEL_PATH,
+                             calibration_samples: int = TFLITE_CALIBRATION_SAMPLES,
+                             drift_samples: int = 100, drift_users: int = 20) -> dict:
+    """
+    Quantize the backbone with false-faces calibration data and record its drift.
+
+    Args:
+        model_path: Where to write the .tflite model, metadata goes next to it
+        calibration_samples: Number of false faces used to calibrate activation ranges
+        drift_samples: Number of other false faces used for the drift report
+        drift_users: Number of stored user heads used for the drift report
+
+    Returns:
+        Metadata written next to the model, including the drift report
+    """
+    faces = sample_false_faces(calibration_samples + drift_samples)
+    if len(faces) < 2:
+        raise ValueError(f"Need false-faces images to calibrate the quantized backbone, got {len(faces)}")
+
+    # Keep a held-out part for the drift report
+    split = max(1, min(len(faces) - 1, len(faces) * calibration_samples // (calibration_samples + drift_samples)))
+    calibration_faces, drift_faces = faces[:split], faces[split:]
+
+    logger.info(f"Quantizing backbone with {len(calibration_faces)} calibration faces...")
+    started_at = time.time()
+    data = convert_backbone(calibration_faces)
+    logger.info(f"Quantized backbone is {len(data) / 1e6:.1f} MB, took {time.time() - started_at:.1f}s")
+
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(model_path, data)
+
+    quantized = QuantizedBackbone(model_path)
+    metadata = {
+        "backbone": BACKBONE_ID,
+        "input_shape": list(INPUT_SHAPE),
+        "calibration_samples": len(calibration_faces),
+        "built_at": time.time()
+    }
+    _write_atomic(_metadata_path(model_path), json.dumps(metadata).encode())
+
+    logger.info(f"Measuring drift on {len(drift_faces)} held-out faces...")
+    metadata["drift"] = drift_report(quantized, drift_faces, load_drift_heads(drift_users))
+    _write_atomic(_metadata_path(model_path), json.dumps(metadata, indent=2).encode())
+
+    logger.info(f"✅ Quantized backbone saved to {model_path}, drift: {metadata['drift']}")
+    return metadata
+
+# Global quantized backbone instance
+quantized_backbone = QuantizedBackbone()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Build the int8 TFLite backbone and report its drift")
+    parser.add_argument("--calibration-samples", type=int, default=TFLITE_CALIBRATION_SAMPLES)
+    parser.add_argument("--drift-samples", type=int, default=100)
+    parser.add_argument("--drift-users", type=int, default=20)
+    args = parser.parse_args()
+
+    from src.preprocess_pool import preprocess_pool
+    try:
+        build_quantized_backbone(
+            calibration_samples=args.calibration_samples,
+            drift_samples=args.drift_samples,
+            drift_users=args.drift_users
+        )
+    finally:
+        preprocess_pool.shutdown()
@@ -1,61 +1,133 @@
+import io
+import time
 import logging
+import h5py
+import numpy as np
 import tensorflow as tf
-from tensorflow.keras.applications import EfficientNetV2B3
-from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
+from tensorflow.keras.layers import Dense, Dropout, Input
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.losses import BinaryCrossentropy
-from pathlib import Path
-import tempfile
-import os
-from src.minio_client import minio_client
+from src.minio_client import minio_client, HEAD_ARTIFACT_NAME
+from src.backbone import extract_embeddings, EMBEDDING_DIM, INFERENCE_XLA
+from src.model_artifacts import serialize_head, deserialize_head
+from src.model_cache import model_cache
+from src.model_disk_cache import model_disk_cache
+from src.face_index import face_index, enrollment_embedding, serialize_enrollment
+from src.metrics import MODEL_LOAD_SECONDS, TRAINING_PHASE_SECONDS, timed
+from src.training_queue import training_queue, TrainingCancelled
 
 logger = logging.getLogger(__name__)
 
-def create_model() -> tf.keras.Model:
+# Locations of the head Dense layers inside a legacy full-model .weights.h5 file
+HEAD_WEIGHT_KEYS = [
+    "layers/dense/vars/0",
+    "layers/dense/vars/1",
+    "layers/dense_1/vars/0",
+    "layers/dense_1/vars/1",
+]
+
+def create_head() -> tf.keras.Model:
     """
-    Create the face authentication model architecture.
-    Uses EfficientNetV2B3 as backbone with custom classification head.
+    Create the per-user classification head that runs on embeddings from the shared backbone.
+    Same layers as the head of the legacy full models, see read_head_weights.
     
     Returns:
-        Compiled Keras model
+        Keras model mapping EMBEDDING_DIM embeddings to a REAL probability
     """
-    # Load EfficientNetV2B3 without top layers, with ImageNet weights
-    base_model = EfficientNetV2B3(
-        input_shape=(224, 224, 3),
-        include_top=False,
-        weights='imagenet'
-    )
-    
-    # Freeze base model layers for faster training
-    base_model.trainable = False
-    
-    # Create classification head with dropout for better generalization
-    model = Sequential([
-        base_model,
-        GlobalAveragePooling2D(),
+    return Sequential([
+        Input(shape=(EMBEDDING_DIM,)),
         Dropout(0.2),
         Dense(256, activation='relu'),
         Dropout(0.1),
-        Dense(1, activation='sigmoid')  # Binary classification
+        Dense(1, activation='sigmoid')
     ])
+
+
+@tf.function(
+    input_signature=[
+        tf.TensorSpec(shape=(None, EMBEDDING_DIM), dtype=tf.float32),
+        tf.TensorSpec(shape=(EMBEDDING_DIM, 256), dtype=tf.float32),
+        tf.TensorSpec(shape=(256,), dtype=tf.float32),
+        tf.TensorSpec(shape=(256, 1), dtype=tf.float32),
+        tf.TensorSpec(shape=(1,), dtype=tf.float32),
+    ],
+    jit_compile=INFERENCE_XLA
+)
+def _head_forward(embeddings, dense_kernel, dense_bias, output_kernel, output_bias):
+    # Same math as create_head at inference time, dropout is a no-op
+    hidden = tf.nn.relu(tf.matmul(embeddings, dense_kernel) + dense_bias)
+    return tf.sigmoid(tf.matmul(hidden, output_kernel) + output_bias)
+
+
+def score_head(head: tf.keras.Model, embeddings: np.ndarray) -> np.ndarray:
+    """
+    Apply a head from create_head with one compiled function shared by every user.
+    The weights are passed as arguments, so a new user never triggers a retrace.
     
-    # Compile model with slightly different learning rate for EfficientNet
-    model.compile(
-        optimizer=Adam(learning_rate=5e-5),  # Lower learning rate for EfficientNet
-        loss=BinaryCrossentropy(),
-        metrics=['accuracy']
-    )
+    Args:
+        head: Head model from create_head
+        embeddings: Backbone embeddings with shape (N, EMBEDDING_DIM)
+        
+    Returns:
+        REAL probabilities with shape (N, 1)
+    """
+    return _head_forward(tf.convert_to_tensor(embeddings, dtype=tf.float32), *head.weights).numpy()
+
+
+def read_head_weights(weights_data: bytes) -> list:
+    """
+    Read only the head Dense weights from a legacy full-model .weights.h5 file.
     
-    return model
+    Args:
+        weights_data: Content of weights saved from a legacy full model (backbone, pooling and head)
+        
+    Returns:
+        List of [kernel, bias, kernel, bias] numpy arrays
+    """
+    with h5py.File(io.BytesIO(weights_data), 'r') as f:
+        missing = [key for key in HEAD_WEIGHT_KEYS if key not in f]
+        if missing:
+            raise ValueError(f"Unexpected weights layout, missing: {missing}")
+        return [f[key][()] for key in HEAD_WEIGHT_KEYS]
 
 
-def train_model(user_id: str):
+def make_embedding_dataset(positives: np.ndarray, negatives: np.ndarray, batch_size: int, shuffle: bool) -> tf.data.Dataset:
+    """
+    Build a labelled tf.data pipeline from positive and negative embeddings.
+    
+    Args:
+        positives: Positive embeddings (label 1)
+        negatives: Negative embeddings (label 0)
+        batch_size: Batch size
+        shuffle: Whether to reshuffle every epoch
+        
+    Returns:
+        Batched dataset of (embedding, label) pairs
+    """
+    embeddings = np.concatenate([negatives, positives]).astype(np.float32)
+    labels = np.concatenate([np.zeros(len(negatives)), np.ones(len(positives))]).astype(np.float32).reshape(-1, 1)
+    
+    ds = tf.data.Dataset.from_tensor_slices((embeddings, labels))
+    if shuffle:
+        ds = ds.shuffle(len(embeddings))
+    
+    return ds.batch(batch_size).prefetch(buffer_size=tf.data.AUTOTUNE)
+
+
+def train_model(user_id: str, train_positives: np.ndarray, val_positives: np.ndarray,
+                train_negatives: np.ndarray, val_negatives: np.ndarray):
     """
     Train a face authentication model for the given user.
+    The head is trained on backbone embeddings: positives are embedded once
+    up front and negatives come precomputed from the negative bank.
     
     Args:
         user_id: User identifier for the training job
+        train_positives: Positive face crops (N, 224, 224, 3) for the training split
+        val_positives: Positive face crops for the validation split
+        train_negatives: Negative embeddings for the training split
+        val_negatives: Negative embeddings for the validation split
     """
     try:
         logger.info(f"Starting model training for user_id: {user_id}")
@@ -69,19 +141,15 @@ def train_model(user_id: str):
         else:
             logger.warning("⚠️  NO GPU DETECTED - Training will use CPU")
         
-        # Define paths
-        user_path = Path(f"/app/data/users/{user_id}")
-        train_path = user_path / "train"
-        val_path = user_path / "val"
-        
-        # No need for local model directory anymore - using MinIO
-        
-        # Create datasets
-        logger.info("Creating training and validation datasets...")
+        # Embed positives once, the frozen backbone gives the same result every epoch
+        logger.info("Embedding positive face images...")
+        with timed(TRAINING_PHASE_SECONDS, phase="embed"):
+            train_positives = extract_embeddings(train_positives.astype(np.float32) / 255.0)
+            val_positives = extract_embeddings(val_positives.astype(np.float32) / 255.0)
         
         # Count total samples to determine appropriate batch size
-        train_samples = len(list((train_path / "positives").glob("*"))) + len(list((train_path / "negatives").glob("*")))
-        val_samples = len(list((val_path / "positives").glob("*"))) + len(list((val_path / "negatives").glob("*")))
+        train_samples = len(train_positives) + len(train_negatives)
+        val_samples = len(val_positives) + len(val_negatives)
         
         # Validate minimum samples
         if train_samples < 4:
@@ -93,56 +161,44 @@ def train_model(user_id: str):
         batch_size = min(4, train_samples, val_samples) if train_samples < 16 or val_samples < 16 else 8
         logger.info(f"Using batch_size: {batch_size} (train_samples: {train_samples}, val_samples: {val_samples})")
         
-        # Training dataset
-        train_ds = tf.keras.preprocessing.image_dataset_from_directory(
-            str(train_path),
-            class_names=['negatives', 'positives'],  # 0=negative, 1=positive
-            image_size=(224, 224),
-            batch_size=batch_size,
-            label_mode='binary'
-        )
+        # Create datasets
+        logger.info("Creating training and validation datasets...")
+        train_ds = make_embedding_dataset(train_positives, train_negatives, batch_size, shuffle=True)
+        val_ds = make_embedding_dataset(val_positives, val_negatives, batch_size, shuffle=False)
         
-        # Validation dataset
-        val_ds = tf.keras.preprocessing.image_dataset_from_directory(
-            str(val_path),
-            class_names=['negatives', 'positives'],  # 0=negative, 1=positive
-            image_size=(224, 224),
-            batch_size=batch_size,
-            label_mode='binary'
+        # Create and compile the classification head
+        logger.info("Creating classification head...")
+        model = create_head()
+        model.compile(
+            optimizer=Adam(learning_rate=5e-5),  # Lower learning rate for EfficientNet
+            loss=BinaryCrossentropy(),
+            metrics=['accuracy']
         )
         
-        # Normalize pixel values to [0,1]
-        def normalize_img(image, label):
-            return tf.cast(image, tf.float32) / 255.0, label
-        
-        train_ds = train_ds.map(normalize_img)
-        val_ds = val_ds.map(normalize_img)
-        
-        # Optimize dataset performance
-        AUTOTUNE = tf.data.AUTOTUNE
-        train_ds = train_ds.cache().shuffle(1000).prefetch(buffer_size=AUTOTUNE)
-        val_ds = val_ds.cache().prefetch(buffer_size=AUTOTUNE)
-        
-        # Create and compile model
-        logger.info("Creating EfficientNetV2B3 model architecture...")
-        model = create_model()
-        
         # Print model summary (with error handling)
         try:
             logger.info("Model architecture:")
             model.summary(print_fn=lambda x: logger.info(x))
         except Exception as e:
             logger.warning(f"Could not print model summary: {e}")
-            logger.info("EfficientNetV2B3 model created successfully despite summary error")
         
         # Train model with more epochs for EfficientNet
         logger.info("Starting training...")
-        history = model.fit(
-            train_ds,
-            validation_data=val_ds,
-            epochs=8,  # Increased epochs for better EfficientNet performance
-            verbose=1
+        training_queue.raise_if_cancelled(user_id)
+        stop_if_cancelled = tf.keras.callbacks.LambdaCallback(
+            on_epoch_end=lambda epoch, logs: setattr(model, "stop_training", training_queue.is_cancelled(user_id))
         )
+        with timed(TRAINING_PHASE_SECONDS, phase="fit"):
+            history = model.fit(
+                train_ds,
+                validation_data=val_ds,
+                epochs=8,  # Increased epochs for better EfficientNet performance
+                verbose=1,
+                callbacks=[stop_if_cancelled]
+            )
+        
+        # The user may have been deleted meanwhile, never publish a model for them
+        training_queue.raise_if_cancelled(user_id)
         
         # Log training results
         final_train_acc = history.history['accuracy'][-1]
@@ -156,25 +212,37 @@ def train_model(user_id: str):
         logger.info(f"Final training loss: {final_train_loss:.4f}")
         logger.info(f"Final validation loss: {final_val_loss:.4f}")
         
-        # Save model weights to temporary file (.weights.h5 format)
-        temp_weights_file = tempfile.NamedTemporaryFile(delete=False, suffix='.weights.h5')
-        temp_weights_path = temp_weights_file.name
-        temp_weights_file.close()
-        
-        model.save_weights(temp_weights_path)
-        logger.info(f"Model weights saved to temporary file: {temp_weights_path}")
+        # Serialize only the head weights, the backbone is shared and never trained
+        head_data = serialize_head(model.get_weights())
+        logger.info(f"Head weights serialized ({len(head_data)} bytes)")
         
         # Upload to MinIO
-        upload_success = minio_client.upload_model(user_id, temp_weights_path)
+        with timed(TRAINING_PHASE_SECONDS, phase="upload"):
+            upload_success = minio_client.upload_model(user_id, head_data)
+            
+            # Make sure no stale head is served after retraining
+            model_cache.invalidate(user_id)
+            
+            # Keep a local copy so the first login does not go back to MinIO
+            if upload_success:
+                model = minio_client.stat_model(user_id)
+                if model is not None:
+                    model_disk_cache.put(user_id, model[0], model[1], head_data)
         
-        # Clean up temporary file
-        os.unlink(temp_weights_path)
+        # Enroll the user for 1:N identification
+        if upload_success:
+            with timed(TRAINING_PHASE_SECONDS, phase="enroll"):
+                enrollment = enrollment_embedding(np.concatenate([train_positives, val_positives]))
+                if minio_client.upload_enrollment(user_id, serialize_enrollment(enrollment)):
+                    face_index.add(user_id, enrollment)
         
         if upload_success:
             logger.info(f"✅ EfficientNetV2B3 model training completed and uploaded successfully for user_id: {user_id}")
         else:
             raise Exception("Failed to upload model to MinIO")
         
+    except TrainingCancelled:
+        raise
     except Exception as e:
         logger.error(f"❌ Error during model training for user_id {user_id}: {e}")
         raise
@@ -182,40 +250,67 @@ def train_model(user_id: str):
 
 def load_trained_model(user_id: str) -> tf.keras.Model:
     """
-    Load a trained model for inference from MinIO.
+    Load a user's trained classification head for inference from MinIO.
+    Only the head weights are read, the backbone is shared (see src.backbone).
     
     Args:
         user_id: User identifier
         
     Returns:
-        Loaded Keras model ready for inference
+        Head model to apply on backbone embeddings (see extract_embeddings)
     """
-    # Download model weights from MinIO
-    temp_weights_path = minio_client.download_model(user_id)
+    started_at = time.perf_counter()
     
-    if temp_weights_path is None:
+    # Find the stored format, full-model weights are from before the head-only format
+    model = minio_client.stat_model(user_id)
+    if model is None:
         raise FileNotFoundError(f"Model not found for user_id: {user_id}")
+    artifact_name, etag = model
     
-    try:
-        # Create model with same architecture
-        model = create_model()
-        
-        # Build the model by calling it with dummy data
-        # This ensures all layers are properly built before loading weights
-        dummy_input = tf.zeros((1, 224, 224, 3))
-        _ = model(dummy_input)
-        
-        # Load weights
-        model.load_weights(temp_weights_path)
-        logger.info(f"Model loaded successfully for user_id: {user_id}")
-        
-        # Clean up temporary file
-        os.unlink(temp_weights_path)
-        
-        return model
+    # Read the local copy of this version, or download model weights from MinIO
+    weights_data = model_disk_cache.get(user_id, artifact_name, etag)
+    tier = "disk"
+    if weights_data is None:
+        tier = "minio"
+        weights_data = minio_client.download_model(user_id, artifact_name)
+        if weights_data is None:
+            raise FileNotFoundError(f"Model not found for user_id: {user_id}")
+        model_disk_cache.put(user_id, artifact_name, etag, weights_data)
+    
+    # Create head and load only its weights
+    if artifact_name == HEAD_ARTIFACT_NAME:
+        weights = deserialize_head(weights_data)
+    else:
+        weights = read_head_weights(weights_data)
+    
+    head = create_head()
+    head.set_weights(weights)
+    MODEL_LOAD_SECONDS.labels(tier=tier).observe(time.perf_counter() - started_at)
+    logger.info(f"Model loaded successfully for user_id: {user_id} (from {tier})")
+    
+    return head
+
+
+def load_cached_model(user_id: str) -> tf.keras.Model:
+    """
+    Get a user's head from the in-memory model cache, loading it on a miss.
+    Loads are timed by load_trained_model with the tier they came from, cache hits are timed here.
+    
+    Args:
+        user_id: User identifier
         
-    except Exception as e:
-        # Clean up temporary file on error
-        if os.path.exists(temp_weights_path):
-            os.unlink(temp_weights_path)
-        raise 
\ No newline at end of file
+    Returns:
+        Head model to apply on backbone embeddings
+    """
+    started_at = time.perf_counter()
+    loaded = False
+    
+    def loader(user_id: str) -> tf.keras.Model:
+        nonlocal loaded
+        loaded = True
+        return load_trained_model(user_id)
+    
+    head = model_cache.get_or_load(user_id, loader)
+    if not loaded:
+        MODEL_LOAD_SECONDS.labels(tier="memory").observe(time.perf_counter() - started_at)
+    return head
@@ -0,0 +1,303 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+from src.metrics import TRAINING_JOBS, TRAINING_PHASE_SECONDS, timed
+from src.user_data import DATA_DIR, REGISTRATION_FACES_FILE, RAW_POSITIVES_DIR, TRAINING_STATUS_FILE, user_dir
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class TrainingCancelled(Exception):
+    """Raised inside a training job whose user was deleted while it was running."""
+
+
+class TrainingQueue:
+    def __init__(self):
+        """Initialize the durable training job queue with settings from environment variables."""
+        self.db_path = Path(os.getenv('TRAINING_QUEUE_DB', str(DATA_DIR / 'training_queue.db')))
+        self.max_workers = int(os.getenv('TRAINING_WORKERS', '1'))
+        self.max_attempts = int(os.getenv('TRAINING_MAX_ATTEMPTS', '2'))
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._handler: Optional[Callable[[str], None]] = None
+        self._workers = []
+        self._stopping = False
+        # Users whose running job was cancelled, checked by the job before it publishes anything
+        self._cancelled = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the SQLite database on first use. Caller holds the lock."""
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority, id)")
+            self._conn = conn
+        return self._conn
+
+    def start(self, handler: Callable[[str], None]):
+        """
+        Recover jobs interrupted by a restart and start the worker threads.
+
+        Args:
+            handler: Function running a training job for a user_id
+        """
+        self._handler = handler
+        self._stopping = False
+        self._recover()
+
+        for i in range(max(1, self.max_workers)):
+            worker = threading.Thread(target=self._work, name=f"training-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+        logger.info(f"Training queue started with {len(self._workers)} worker(s) using {self.db_path}")
+
+    def stop(self):
+        """Ask workers to exit once their current job is done."""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def _recover(self):
+        """
+        Requeue jobs that were running when the process stopped, or fail them after too many attempts.
+        Queued and running jobs whose registration images or crops are gone are failed as well.
+        """
+        with self._lock:
+            conn = self._connection()
+            active = conn.execute(
+                "SELECT id, user_id, status, attempts FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+            ).fetchall()
+
+            for job in active:
+                if not _registration_saved(job["user_id"]):
+                    error = "Registration lost on restart, please register again"
+                elif job["status"] == "queued":
+                    continue
+                elif job["attempts"] < self.max_attempts:
+                    conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE id = ?", (job["id"],))
+                    logger.info(f"Requeued interrupted training job {job['id']} for user_id: {job['user_id']}")
+                    continue
+                else:
+                    error = "Interrupted by restart"
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                    (error, time.time(), job["id"])
+                )
+                _write_training_status(job["user_id"], "training_failed")
+                logger.warning(f"Failed training job {job['id']} for user_id {job['user_id']}: {error}")
+
+    def enqueue(self, user_id: str, priority: int = 0) -> int:
+        """
+        Add a training job for a user, unless one is already queued or running.
+
+        Args:
+            user_id: User identifier
+            priority: Higher priority jobs run first, FIFO within the same priority
+
+        Returns:
+            ID of the new or already active job
+        """
+        with self._wakeup:
+            conn = self._connection()
+            existing = conn.execute(
+                "SELECT id FROM jobs WHERE user_id = ? AND status IN (?, ?)",
+                (user_id,) + ACTIVE_STATUSES
+            ).fetchone()
+            if existing is not None:
+                return existing["id"]
+
+            cursor = conn.execute(
+                "INSERT INTO jobs (user_id, status, priority, created_at) VALUES (?, 'queued', ?, ?)",
+                (user_id, priority, time.time())
+            )
+            self._wakeup.notify()
+            return cursor.lastrowid
+
+    def cancel(self, user_id: str, timeout: float = 60.0) -> int:
+        """
+        Cancel a user's jobs, e.g. when the user is deleted.
+        Queued jobs are cancelled right away. A running job is asked to stop before it uploads
+        or enrolls anything, and this waits for it so nothing is published after it returns.
+
+        Args:
+            user_id: User identifier
+            timeout: Seconds to wait for a running job to stop
+
+        Returns:
+            Number of cancelled jobs
+        """
+        with self._wakeup:
+            conn = self._connection()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE user_id = ? AND status = 'queued'",
+                (time.time(), user_id)
+            )
+            cancelled = cursor.rowcount
+
+            if self._running_job(user_id) is None:
+                return cancelled
+
+            self._cancelled.add(user_id)
+            if not self._wakeup.wait_for(lambda: self._running_job(user_id) is None, timeout=timeout):
+                logger.warning(f"Running training job for user_id {user_id} did not stop within {timeout:.0f}s")
+            return cancelled + 1
+
+    def is_cancelled(self, user_id: str) -> bool:
+        """Whether the user's running job was cancelled."""
+        with self._lock:
+            return user_id in self._cancelled
+
+    def raise_if_cancelled(self, user_id: str):
+        """
+        Stop a running job whose user was deleted.
+
+        Raises:
+            TrainingCancelled: If the user's job was cancelled
+        """
+        if self.is_cancelled(user_id):
+            raise TrainingCancelled(f"Training for user_id {user_id} was cancelled")
+
+    def _running_job(self, user_id: str) -> Optional[sqlite3.Row]:
+        """Get the user's running job. Caller holds the lock."""
+        return self._connection().execute(
+            "SELECT id FROM jobs WHERE user_id = ? AND status = 'running'", (user_id,)
+        ).fetchone()
+
+    def job_status(self, user_id: str) -> Optional[dict]:
+        """
+        Get the state of a user's active job.
+
+        Args:
+            user_id: User identifier
+
+        Returns:
+            Dict with job_id, status and queue_position (0 while running), or None if no active job
+        """
+        with self._lock:
+            conn = self._connection()
+            job = conn.execute(
+                "SELECT id, status, priority FROM jobs WHERE user_id = ? AND status IN (?, ?) ORDER BY id DESC",
+                (user_id,) + ACTIVE_STATUSES
+            ).fetchone()
+            if job is None:
+                return None
+
+            position = 0
+            if job["status"] == "queued":
+                ahead = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND id < ?))",
+                    (job["priority"], job["priority"], job["id"])
+                ).fetchone()[0]
+                position = ahead + 1
+
+            return {
+                "job_id": job["id"],
+                "status": job["status"],
+                "queue_position": position
+            }
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Mark the next queued job as running. Caller holds the lock."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            job = conn.execute(
+                "SELECT id, user_id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id ASC LIMIT 1"
+            ).fetchone()
+            if job is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (time.time(), job["id"])
+                )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, job_id: int, user_id: str, status: str, error: Optional[str] = None):
+        with self._wakeup:
+            self._connection().execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+            self._cancelled.discard(user_id)
+            # Wake up cancel() calls waiting for this job
+            self._wakeup.notify_all()
+
+    def _work(self):
+        while True:
+            with self._wakeup:
+                job = None
+                while not self._stopping:
+                    job = self._claim_next()
+                    if job is not None:
+                        break
+                    self._wakeup.wait(timeout=5.0)
+                if self._stopping:
+                    return
+
+            logger.info(f"Running training job {job['id']} for user_id: {job['user_id']}")
+            try:
+                with timed(TRAINING_PHASE_SECONDS, phase="total"):
+                    self._handler(job["user_id"])
+                self._finish(job["id"], job["user_id"], "completed")
+                TRAINING_JOBS.labels(result="completed").inc()
+            except TrainingCancelled:
+                logger.info(f"Training job {job['id']} for user_id {job['user_id']} was cancelled")
+                self._finish(job["id"], job["user_id"], "cancelled")
+                TRAINING_JOBS.labels(result="cancelled").inc()
+            except Exception as e:
+                logger.error(f"Training job {job['id']} for user_id {job['user_id']} failed: {e}")
+                self._finish(job["id"], job["user_id"], "failed", str(e))
+                TRAINING_JOBS.labels(result="failed").inc()
+
+    def stats(self) -> dict:
+        """Get job counts by status."""
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+            return {
+                "workers": self.max_workers,
+                "jobs": {row["status"]: row["count"] for row in rows}
+            }
+
+
+def _registration_saved(user_id: str) -> bool:
+    """Whether a user's registration crops (or its debug layout uploads) are still on disk."""
+    user_path = user_dir(user_id)
+    return (user_path / REGISTRATION_FACES_FILE).exists() or (user_path / RAW_POSITIVES_DIR).exists()
+
+
+def _write_training_status(user_id: str, status: str):
+    """Update a user's training_status.txt if the user still has local data."""
+    status_file = user_dir(user_id) / TRAINING_STATUS_FILE
+    if status_file.exists():
+        status_file.write_text(status)
+
+# Global training queue instance
+training_queue = TrainingQueue()
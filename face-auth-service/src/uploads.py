@@ -0,0 +1,147 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+REGISTER_MAX_FILE_BYTES = int(os.getenv('REGISTER_MAX_FILE_BYTES', str(10 * 1024 * 1024)))
+REGISTER_MAX_REQUEST_BYTES = int(os.getenv('REGISTER_MAX_REQUEST_BYTES', str(200 * 1024 * 1024)))
+REGISTER_MAX_FILES = int(os.getenv('REGISTER_MAX_FILES', '100'))
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        """
+        Rejected multipart upload.
+
+        Args:
+            status_code: HTTP status to answer with
+            detail: Message for the client
+        """
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadedFile:
+    field_name: str
+    filename: Optional[str]
+    content_type: Optional[str]
+    content: bytes
+
+
+class _PartCollector:
+    """Callbacks for MultipartParser that collect complete file parts with size limits."""
+
+    def __init__(self, max_file_bytes: int, max_files: int):
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.completed: List[UploadedFile] = []
+        self.files = 0
+
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._data = bytearray()
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._data = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" in options:
+            self.files += 1
+            if self.files > self.max_files:
+                raise UploadError(413, f"At most {self.max_files} files are accepted")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if len(self._data) + end - start > self.max_file_bytes:
+            raise UploadError(413, f"Files must be smaller than {self.max_file_bytes} bytes")
+        self._data += data[start:end]
+
+    def on_part_end(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            # Plain form fields are not used by the streaming endpoints
+            return
+
+        content_type = self._headers.get(b"content-type")
+        self.completed.append(UploadedFile(
+            field_name=options.get(b"name", b"").decode("latin-1"),
+            filename=options[b"filename"].decode("utf-8", errors="replace"),
+            content_type=content_type.decode("latin-1") if content_type else None,
+            content=bytes(self._data)
+        ))
+        self._data = bytearray()
+
+
+async def stream_uploaded_files(request: Request,
+                                max_file_bytes: int = REGISTER_MAX_FILE_BYTES,
+                                max_request_bytes: int = REGISTER_MAX_REQUEST_BYTES,
+                                max_files: int = REGISTER_MAX_FILES) -> AsyncIterator[UploadedFile]:
+    """
+    Parse a multipart/form-data body while it arrives, yielding each file as soon as it is complete.
+    Only the file currently being received is buffered, and limits are enforced as data comes in.
+
+    Args:
+        request: Incoming request
+        max_file_bytes: Maximum size of one file
+        max_request_bytes: Maximum size of the whole body
+        max_files: Maximum number of files
+
+    Yields:
+        Uploaded files in request order
+
+    Raises:
+        UploadError: If the body is not multipart or exceeds a limit
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError(400, "Expected a multipart/form-data body")
+
+    # Reject oversized bodies before reading them when the client announces the size
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_request_bytes:
+        raise UploadError(413, f"Request body must be smaller than {max_request_bytes} bytes")
+
+    collector = _PartCollector(max_file_bytes, max_files)
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": collector.on_part_begin,
+        "on_part_data": collector.on_part_data,
+        "on_part_end": collector.on_part_end,
+        "on_header_field": collector.on_header_field,
+        "on_header_value": collector.on_header_value,
+        "on_header_end": collector.on_header_end,
+        "on_headers_finished": collector.on_headers_finished,
+    })
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_request_bytes:
+            raise UploadError(413, f"Request body must be smaller than {max_request_bytes} bytes")
+
+        parser.write(chunk)
+        for uploaded_file in collector.completed:
+            yield uploaded_file
+        collector.completed.clear()
+
+    parser.finalize()
+    for uploaded_file in collector.completed:
+        yield uploaded_file
@@ -0,0 +1,22 @@
+import os
+from pathlib import Path
+
+# Root of the service's local state, the defaults of the other data paths live under it
+DATA_DIR = Path(os.getenv('DATA_DIR', '/app/data'))
+
+# Root of the per-user directories
+USERS_DIR = DATA_DIR / "users"
+
+# Face crops of a registration waiting for its training job, in the user's directory so
+# queued and interrupted jobs survive a restart. Removed once the job has finished.
+REGISTRATION_FACES_FILE = "registration_faces.npy"
+
+# Uploads of a registration saved in the debug layout
+RAW_POSITIVES_DIR = "raw_positives"
+
+TRAINING_STATUS_FILE = "training_status.txt"
+
+
+def user_dir(user_id: str) -> Path:
+    """Get the local data directory of a user."""
+    return USERS_DIR / user_id
@@ -5,85 +5,95 @@ import random
 import logging
 import cv2
 import numpy as np
-from pathlib import Path
 from typing import List, Optional, Tuple
-import tensorflow as tf
-import mediapipe as mp
+from src.metrics import TRAINING_PHASE_SECONDS, timed
+from src.training_queue import TrainingCancelled
+from src.user_data import REGISTRATION_FACES_FILE, RAW_POSITIVES_DIR, TRAINING_STATUS_FILE, user_dir
 
 logger = logging.getLogger(__name__)
 
-# Initialize MediaPipe Face Detection
-mp_face_detection = mp.solutions.face_detection
-mp_drawing = mp.solutions.drawing_utils
+# Keep the old on-disk registration layout (raw/processed/train/val folders) for debugging
+REGISTRATION_DEBUG_DIRS = os.getenv('REGISTRATION_DEBUG_DIRS', 'false').lower() == 'true'
 
-def detect_and_crop_face(image: np.ndarray, target_size: Tuple[int, int] = (224, 224)) -> Optional[np.ndarray]:
+
+def save_registration_faces(user_id: str, faces: np.ndarray):
+    """Persist a registration's face crops until its training job runs."""
+    faces_path = user_dir(user_id) / REGISTRATION_FACES_FILE
+    temp_path = faces_path.with_name(f".tmp-{REGISTRATION_FACES_FILE}")
+    
+    # Write to a temporary file first so a crash never leaves partial crops behind
+    with open(temp_path, "wb") as f:
+        np.save(f, faces)
+    os.replace(temp_path, faces_path)
+
+
+def load_saved_registration_faces(user_id: str) -> Optional[np.ndarray]:
+    """Read a registration's saved face crops, or None if it was registered in the debug layout."""
+    faces_path = user_dir(user_id) / REGISTRATION_FACES_FILE
+    if not faces_path.exists():
+        return None
+    return np.load(faces_path)
+
+
+def load_registration_faces(user_id: str) -> np.ndarray:
     """
-    Detect face in image using MediaPipe and crop to target size.
+    Detect and crop faces from the uploads saved in raw_positives (debug layout).
+    Crops are also written to processed_positives for inspection.
     
     Args:
-        image: Input image as numpy array
-        target_size: Target size for cropped face (width, height)
+        user_id: User identifier
         
     Returns:
-        Cropped face image or None if no face detected
+        Face crops with shape (N, 224, 224, 3) as uint8 RGB
     """
-    try:
-        # Convert BGR to RGB for MediaPipe
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    user_path = user_dir(user_id)
+    raw_positives_path = user_path / RAW_POSITIVES_DIR
+    processed_positives_path = user_path / "processed_positives"
+    
+    # Start from a clean slate in case a previous attempt was interrupted
+    for path in [processed_positives_path, user_path / "train", user_path / "val"]:
+        if path.exists():
+            shutil.rmtree(path)
+    processed_positives_path.mkdir(parents=True, exist_ok=True)
+    
+    # Crop all uploads in parallel, results come back in file order
+    from src.preprocess_pool import preprocess_pool
+    image_paths = sorted(raw_positives_path.glob("*"))
+    face_crops = preprocess_pool.map(image_paths)
+    
+    faces = []
+    for idx, (image_path, face_crop) in enumerate(zip(image_paths, face_crops)):
+        if face_crop is None:
+            logger.warning(f"No face detected in image: {image_path}")
+            continue
         
-        with mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5) as face_detection:
-            results = face_detection.process(rgb_image)
-            
-            if not results.detections:
-                logger.warning("No face detected in image")
-                return None
-            
-            # Use the first (most confident) detection
-            detection = results.detections[0]
-            bboxC = detection.location_data.relative_bounding_box
-            
-            # Convert relative coordinates to absolute
-            h, w, _ = image.shape
-            x = int(bboxC.xmin * w)
-            y = int(bboxC.ymin * h)
-            width = int(bboxC.width * w)
-            height = int(bboxC.height * h)
-            
-            # Add some padding around the face
-            padding = 0.2  # 20% padding
-            pad_x = int(width * padding)
-            pad_y = int(height * padding)
-            
-            # Ensure coordinates are within image bounds
-            x1 = max(0, x - pad_x)
-            y1 = max(0, y - pad_y)
-            x2 = min(w, x + width + pad_x)
-            y2 = min(h, y + height + pad_y)
-            
-            # Crop face
-            face_crop = image[y1:y2, x1:x2]
-            
-            if face_crop.size == 0:
-                logger.warning("Empty face crop detected")
-                return None
-            
-            # Convert to grayscale then back to RGB for model compatibility
-            gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
-            rgb_face = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
-            
-            # Resize to target size
-            resized_face = cv2.resize(rgb_face, target_size)
-            
-            return resized_face
-            
-    except Exception as e:
-        logger.error(f"Error in face detection and cropping: {e}")
-        return None
+        # Save processed face
+        output_path = processed_positives_path / f"positive_{idx:04d}.jpg"
+        cv2.imwrite(str(output_path), cv2.cvtColor(face_crop, cv2.COLOR_RGB2BGR))
+        faces.append(face_crop)
+    
+    if not faces:
+        return np.zeros((0, 224, 224, 3), dtype=np.uint8)
+    
+    return np.stack(faces)
+
+
+def save_debug_splits(user_id: str, train_positives: np.ndarray, val_positives: np.ndarray):
+    """Write the positive train/val split as images in the debug layout."""
+    user_path = user_dir(user_id)
+    
+    for split_name, faces in [("train", train_positives), ("val", val_positives)]:
+        split_path = user_path / split_name / "positives"
+        split_path.mkdir(parents=True, exist_ok=True)
+        for idx, face in enumerate(faces):
+            cv2.imwrite(str(split_path / f"positive_{idx:04d}.jpg"), cv2.cvtColor(face, cv2.COLOR_RGB2BGR))
+
 
 def preprocess_and_train(user_id: str):
     """
     Main preprocessing and training pipeline for a user registration job.
-    Now with MediaPipe face detection.
+    Face crops come from the file written by save_registration_faces, or from
+    raw_positives when the registration was saved in the debug layout.
     
     Args:
         user_id: User identifier for the training job
@@ -91,129 +101,54 @@ def preprocess_and_train(user_id: str):
     try:
         logger.info(f"Starting preprocessing and training for user_id: {user_id}")
         
-        # Define paths  
-        user_path = Path(f"/app/data/users/{user_id}")
-        raw_positives_path = user_path / "raw_positives"
-        processed_positives_path = user_path / "processed_positives"
-        processed_negatives_path = user_path / "processed_negatives"
-        train_path = user_path / "train"
-        val_path = user_path / "val"
-        
-        # Create necessary directories
-        processed_positives_path.mkdir(parents=True, exist_ok=True)
-        processed_negatives_path.mkdir(parents=True, exist_ok=True)
-        
-        # Step 1: Preprocess positive images with face detection
-        logger.info("Step 1: Detecting faces and preprocessing positive images...")
-        positive_files = list(raw_positives_path.glob("*"))
-        processed_positives = []
+        # Step 1: Get positive face crops
+        with timed(TRAINING_PHASE_SECONDS, phase="faces"):
+            positives = load_saved_registration_faces(user_id)
+            if positives is None:
+                logger.info("Step 1: Detecting faces and preprocessing positive images from disk...")
+                positives = load_registration_faces(user_id)
+            else:
+                logger.info("Step 1: Using the face crops saved at registration...")
         
-        for idx, image_path in enumerate(positive_files):
-            try:
-                # Read image
-                img = cv2.imread(str(image_path))
-                if img is None:
-                    logger.warning(f"Could not read image: {image_path}")
-                    continue
-                
-                # Detect and crop face using MediaPipe
-                face_crop = detect_and_crop_face(img, target_size=(224, 224))
-                
-                if face_crop is None:
-                    logger.warning(f"No face detected in image: {image_path}")
-                    continue
-                
-                # Save processed face
-                output_path = processed_positives_path / f"positive_{idx:04d}.jpg"
-                cv2.imwrite(str(output_path), cv2.cvtColor(face_crop, cv2.COLOR_RGB2BGR))
-                processed_positives.append(output_path)
-                
-            except Exception as e:
-                logger.error(f"Error processing positive image {image_path}: {e}")
-        
-        num_positives = len(processed_positives)
+        num_positives = len(positives)
         logger.info(f"Processed {num_positives} positive face images")
         
         # Check minimum dataset requirements
         if num_positives < 2:
             raise ValueError(f"Need at least 2 valid faces for training, got {num_positives}")
         
-        # Step 2: Sample and preprocess negative images (also with face detection)
-        logger.info("Step 2: Sampling and preprocessing negative face images...")
-        false_faces_path = Path("/app/data/false-faces")
-        all_negatives = list(false_faces_path.glob("*"))
+        # Step 2: Sample negative embeddings from the precomputed negative bank
+        logger.info("Step 2: Sampling negative face embeddings...")
+        from src.negative_bank import sample_negative_embeddings
         
         # Sample 2x the number of positives
         num_negatives_needed = 2 * num_positives
-        selected_negatives = random.sample(all_negatives, min(num_negatives_needed, len(all_negatives)))
-        
-        processed_negatives = []
-        for idx, image_path in enumerate(selected_negatives):
-            try:
-                # Read and process similar to positives
-                img = cv2.imread(str(image_path))
-                if img is None:
-                    continue
-                
-                # For negative samples, they might already be face crops
-                # So try face detection first, fallback to simple resize if no face
-                face_crop = detect_and_crop_face(img, target_size=(224, 224))
-                
-                if face_crop is None:
-                    # Fallback: simple grayscale + resize
-                    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                    rgb_img = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
-                    face_crop = cv2.resize(rgb_img, (224, 224))
-                
-                output_path = processed_negatives_path / f"negative_{idx:04d}.jpg"
-                cv2.imwrite(str(output_path), cv2.cvtColor(face_crop, cv2.COLOR_RGB2BGR))
-                processed_negatives.append(output_path)
-                
-            except Exception as e:
-                logger.error(f"Error processing negative image {image_path}: {e}")
+        with timed(TRAINING_PHASE_SECONDS, phase="negatives"):
+            negative_embeddings = sample_negative_embeddings(num_negatives_needed)
         
-        logger.info(f"Processed {len(processed_negatives)} negative face images")
+        logger.info(f"Sampled {len(negative_embeddings)} negative face embeddings")
         
         # Check we have enough negatives
-        if len(processed_negatives) < 2:
-            raise ValueError(f"Need at least 2 valid negative images for training, got {len(processed_negatives)}")
+        if len(negative_embeddings) < 2:
+            raise ValueError(f"Need at least 2 valid negative images for training, got {len(negative_embeddings)}")
         
         # Step 3: Split into train/validation sets
         logger.info("Step 3: Creating train/validation splits...")
         
         # Shuffle and split positives (80/20 but ensure at least 1 in each split)
-        random.shuffle(processed_positives)
-        pos_split_idx = max(1, min(len(processed_positives) - 1, int(0.8 * len(processed_positives))))
-        train_positives = processed_positives[:pos_split_idx]
-        val_positives = processed_positives[pos_split_idx:]
+        np.random.shuffle(positives)
+        pos_split_idx = max(1, min(len(positives) - 1, int(0.8 * len(positives))))
+        train_positives = positives[:pos_split_idx]
+        val_positives = positives[pos_split_idx:]
         
         # Shuffle and split negatives (80/20 but ensure at least 1 in each split)
-        random.shuffle(processed_negatives)
-        neg_split_idx = max(1, min(len(processed_negatives) - 1, int(0.8 * len(processed_negatives))))
-        train_negatives = processed_negatives[:neg_split_idx]
-        val_negatives = processed_negatives[neg_split_idx:]
-        
-        # Create train/val directory structure
-        train_pos_path = train_path / "positives"
-        train_neg_path = train_path / "negatives"
-        val_pos_path = val_path / "positives"
-        val_neg_path = val_path / "negatives"
-        
-        for path in [train_pos_path, train_neg_path, val_pos_path, val_neg_path]:
-            path.mkdir(parents=True, exist_ok=True)
-        
-        # Copy files to train/val directories
-        for img_path in train_positives:
-            shutil.copy2(img_path, train_pos_path / img_path.name)
+        np.random.shuffle(negative_embeddings)
+        neg_split_idx = max(1, min(len(negative_embeddings) - 1, int(0.8 * len(negative_embeddings))))
+        train_negatives = negative_embeddings[:neg_split_idx]
+        val_negatives = negative_embeddings[neg_split_idx:]
         
-        for img_path in train_negatives:
-            shutil.copy2(img_path, train_neg_path / img_path.name)
-            
-        for img_path in val_positives:
-            shutil.copy2(img_path, val_pos_path / img_path.name)
-            
-        for img_path in val_negatives:
-            shutil.copy2(img_path, val_neg_path / img_path.name)
+        if REGISTRATION_DEBUG_DIRS:
+            save_debug_splits(user_id, train_positives, val_positives)
         
         logger.info(f"Train split - Positives: {len(train_positives)}, Negatives: {len(train_negatives)}")
         logger.info(f"Val split - Positives: {len(val_positives)}, Negatives: {len(val_negatives)}")
@@ -221,31 +156,38 @@ def preprocess_and_train(user_id: str):
         # Step 4: Train the model
         logger.info("Step 4: Starting model training...")
         from src.train import train_model
-        train_model(user_id)
+        from src.profiling import profiler
+        with profiler.traced("train"):
+            train_model(user_id, train_positives, val_positives, train_negatives, val_negatives)
         
         # Step 5: Cleanup temporary directories
         logger.info("Step 5: Cleaning up temporary files...")
-        cleanup_training_files(user_id)
+        with timed(TRAINING_PHASE_SECONDS, phase="cleanup"):
+            cleanup_training_files(user_id)
         
         # Update training status to completed
-        user_path = Path(f"/app/data/users/{user_id}")
-        status_file = user_path / "training_status.txt"
+        user_path = user_dir(user_id)
+        status_file = user_path / TRAINING_STATUS_FILE
         if status_file.exists():
             with open(status_file, 'w') as f:
                 f.write("training_completed")
         
         logger.info(f"Training completed successfully for user_id: {user_id}")
         
+    except TrainingCancelled:
+        # The user was deleted, there is no status left to update
+        raise
     except Exception as e:
         logger.error(f"Error in preprocessing and training for user_id {user_id}: {e}")
         
         # Update training status to failed
         try:
-            user_path = Path(f"/app/data/users/{user_id}")
-            status_file = user_path / "training_status.txt"
+            user_path = user_dir(user_id)
+            status_file = user_path / TRAINING_STATUS_FILE
             if status_file.exists():
                 with open(status_file, 'w') as f:
                     f.write("training_failed")
+            (user_path / REGISTRATION_FACES_FILE).unlink(missing_ok=True)
         except:
             pass
         
@@ -254,12 +196,11 @@ def preprocess_and_train(user_id: str):
 
 def cleanup_training_files(user_id: str):
     """Clean up temporary training files after successful training."""
-    user_path = Path(f"/app/data/users/{user_id}")
+    user_path = user_dir(user_id)
     
     dirs_to_remove = [
-        "raw_positives",
-        "processed_positives", 
-        "processed_negatives",
+        RAW_POSITIVES_DIR,
+        "processed_positives",
         "train",
         "val"
     ]
@@ -269,6 +210,8 @@ def cleanup_training_files(user_id: str):
         if dir_path.exists():
             shutil.rmtree(dir_path)
             logger.info(f"Removed temporary directory: {dir_path}")
+    
+    (user_path / REGISTRATION_FACES_FILE).unlink(missing_ok=True)
 
 
 def model_exists(user_id: str) -> bool:
@@ -287,22 +230,10 @@ def preprocess_single_image(image_bytes: bytes) -> np.ndarray:
     Returns:
         Preprocessed image tensor ready for model inference
     """
-    # Convert bytes to numpy array
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    
-    if img is None:
-        raise ValueError("Could not decode image")
-    
-    # Detect and crop face using MediaPipe
-    face_crop = detect_and_crop_face(img, target_size=(224, 224))
-    
-    if face_crop is None:
-        # Fallback: simple preprocessing if no face detected
-        logger.warning("No face detected, using fallback preprocessing")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        rgb_img = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
-        face_crop = cv2.resize(rgb_img, (224, 224))
+    # Decode at reduced scale for large photos, detect and crop the face using MediaPipe.
+    # Falls back to a plain grayscale resize if no face is detected
+    from src.face_detection import decode_and_crop_face
+    face_crop = decode_and_crop_face(image_bytes, target_size=(224, 224), fallback=True)
     
     # Normalize to [0,1] and add batch dimension
     normalized = face_crop.astype(np.float32) / 255.0
@@ -311,6 +242,35 @@ def preprocess_single_image(image_bytes: bytes) -> np.ndarray:
     return batched
 
 
+# How /verify-multi combines per-frame scores: mean, median or k_of_n
+VERIFY_AGGREGATION = os.getenv('VERIFY_AGGREGATION', 'mean').lower()
+VERIFY_K_OF_N = int(os.getenv('VERIFY_K_OF_N', '2'))
+AGGREGATION_METHODS = ("mean", "median", "k_of_n")
+
+
+def aggregate_scores(scores: np.ndarray, method: str = VERIFY_AGGREGATION, k: int = VERIFY_K_OF_N) -> float:
+    """
+    Combine the REAL probabilities of several frames of one login attempt.
+    
+    Args:
+        scores: Per-frame probabilities
+        method: mean, median or k_of_n
+        k: For k_of_n, number of frames that have to pass (capped at the number of frames)
+        
+    Returns:
+        Aggregated probability. For k_of_n this is the k-th highest frame score,
+        so it is above a threshold exactly when at least k frames are.
+    """
+    if method == "mean":
+        return float(np.mean(scores))
+    if method == "median":
+        return float(np.median(scores))
+    if method == "k_of_n":
+        k = max(1, min(k, len(scores)))
+        return float(np.sort(scores)[::-1][k - 1])
+    raise ValueError(f"Unknown aggregation method: {method}")
+
+
 def generate_job_id() -> str:
     """Generate a unique job ID."""
     return str(uuid.uuid4())
@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _default_batch_sizes(max_batch_size: int) -> List[int]:
+    """Powers of two up to the scheduler's largest batch, plus that batch size itself."""
+    sizes = set()
+    size = 1
+    while size < max_batch_size:
+        sizes.add(size)
+        size *= 2
+    sizes.add(max(1, max_batch_size))
+    return sorted(sizes)
+
+
+class StartupWarmUp:
+    def __init__(self):
+        """Initialize the startup warm-up with settings from environment variables."""
+        self.enabled = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+
+        batch_sizes = os.getenv('WARMUP_BATCH_SIZES', '')
+        self.batch_sizes = [int(size) for size in batch_sizes.split(',') if size.strip()]
+
+        self.preload_user_ids = [user_id.strip() for user_id in os.getenv('PRELOAD_USER_IDS', '').split(',') if user_id.strip()]
+        self.preload_recent_users = int(os.getenv('PRELOAD_RECENT_USERS', '50'))
+
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.state = "pending"
+        self.step_seconds = {}
+        self.preloaded = 0
+        self.error: Optional[str] = None
+
+    def start(self):
+        """Run the warm-up in a background thread, the service reports ready once it is done."""
+        self._thread = threading.Thread(target=self.run, name="startup-warmup", daemon=True)
+        self._thread.start()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def run(self):
+        """
+        Build the backbone, trace inference at the served batch sizes, start detectors, connect
+        to MinIO and preload models, then load the face index. Requests need MinIO and the face
+        index, so those two are also made with WARMUP_ENABLED=false or after a failed step.
+        """
+        self.state = "running"
+        started_at = time.perf_counter()
+        try:
+            # The heavy imports happen here, not when the service process starts
+            if self.enabled:
+                self._step("backbone", self._warm_backbone)
+                self._step("inference", self._warm_inference)
+                self._step("detectors", self._warm_detectors)
+            self._step("minio", self._connect_minio)
+            if self.enabled:
+                self._step("preload", self._preload_models)
+            self.state = "completed" if self.enabled else "skipped"
+            logger.info(f"✅ Warm-up completed in {time.perf_counter() - started_at:.1f}s "
+                        f"({self.preloaded} models preloaded)")
+        except Exception as e:
+            # A failed warm-up only means the first requests are slow, so still report ready
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"❌ Warm-up failed: {e}")
+        finally:
+            # Nothing works without MinIO, so never report ready before it answers. The face index
+            # is built whatever happened above, /identify answers 503 until it is
+            self._connect_minio()
+            try:
+                self._step("face_index", self._build_face_index)
+            finally:
+                self._ready.set()
+
+    def _step(self, name: str, fn):
+        started_at = time.perf_counter()
+        logger.info(f"Warm-up: {name}...")
+        fn()
+        self.step_seconds[name] = time.perf_counter() - started_at
+
+    def _warm_backbone(self):
+        from src.backbone import get_backbone
+        get_backbone()
+
+    def _warm_inference(self):
+        from src.backbone import extract_inference_embeddings, INPUT_SHAPE
+        from src.inference_scheduler import inference_scheduler
+        from src.train import create_head, score_head
+
+        head = create_head()
+        for batch_size in self.batch_sizes or _default_batch_sizes(inference_scheduler.max_batch_size):
+            embeddings = extract_inference_embeddings(np.zeros((batch_size,) + INPUT_SHAPE, dtype=np.float32))
+            score_head(head, embeddings)
+
+    def _warm_detectors(self):
+        from src.face_detection import get_detector_pool
+        from src.preprocess_pool import preprocess_pool
+
+        get_detector_pool().warm_up()
+        preprocess_pool.warm_up()
+
+    def _connect_minio(self):
+        from src.minio_client import minio_client
+        minio_client.connect()
+
+    def _build_face_index(self):
+        from src.face_index import face_index
+        face_index.rebuild()
+
+    def _preload_models(self):
+        from src.model_cache import model_cache
+        from src.model_disk_cache import model_disk_cache
+        from src.train import load_trained_model
+
+        # Configured users first, then the most recently used ones found in the disk cache
+        user_ids = list(dict.fromkeys(self.preload_user_ids + model_disk_cache.recent_user_ids(self.preload_recent_users)))
+
+        for user_id in user_ids:
+            try:
+                model_cache.get_or_load(user_id, load_trained_model)
+                self.preloaded += 1
+            except Exception as e:
+                logger.warning(f"Could not preload model for user_id {user_id}: {e}")
+
+    def stats(self) -> dict:
+        """Get warm-up progress and step durations."""
+        return {
+            "state": self.state,
+            "ready": self.is_ready(),
+            "step_seconds": dict(self.step_seconds),
+            "preloaded": self.preloaded,
+            "error": self.error
+        }
+
+# Global startup warm-up instance
+startup_warmup = StartupWarmUp()
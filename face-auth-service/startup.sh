@@ -52,6 +52,32 @@ else
     fi
 fi
 
+# Build the negative embedding bank and the int8 TFLite backbone in the background, so they
+# never delay or abort the server start. Until they exist the service embeds negatives on the
+# fly and verifies with the float backbone, and picks them up once they are written.
+build_artifacts() {
+    # Build the negative embedding bank once the false-faces pool is available
+    NEGATIVE_BANK_PATH="${NEGATIVE_BANK_PATH:-/app/data/negative_bank.npz}"
+    if [ -d "/app/data/false-faces" ] && { [ ! -f "$NEGATIVE_BANK_PATH" ] || [ "/app/data/.downloaded" -nt "$NEGATIVE_BANK_PATH" ]; }; then
+        echo "🧮 Building negative embedding bank in the background..."
+        python -m src.negative_bank && echo "✅ Negative bank ready!" \
+            || echo "⚠️  Negative bank build failed, skipped (negatives are embedded on the fly)"
+    else
+        echo "ℹ️  Negative bank up to date or no false-faces data, skipping..."
+    fi
+
+    # Build the int8 TFLite backbone when it is the configured inference backend
+    TFLITE_MODEL_PATH="${TFLITE_MODEL_PATH:-/app/data/backbone_int8.tflite}"
+    if [ "$INFERENCE_BACKEND" = "tflite" ] && [ -d "/app/data/false-faces" ] && { [ ! -f "$TFLITE_MODEL_PATH" ] || [ "/app/data/.downloaded" -nt "$TFLITE_MODEL_PATH" ]; }; then
+        echo "🗜️  Building quantized backbone in the background..."
+        python -m src.tflite_backend && echo "✅ Quantized backbone ready!" \
+            || echo "⚠️  Quantized backbone build failed, skipped (verification uses the Keras backbone)"
+    fi
+}
+
+echo ""
+build_artifacts &
+
 echo ""
 echo "🎯 Starting uvicorn server..."
 exec uvicorn src.main:app --host 0.0.0.0 --port 8000 --reload 
\ No newline at end of file
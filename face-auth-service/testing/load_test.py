@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Face Authentication Load Test
+
+Drives /register, /status and /verify concurrently with X-User-ID headers and reports
+throughput, p50/p95/p99 latency and error rate per endpoint, to capacity-plan nodes.
+
+Setup registers --users users and waits for their training. The first --warm-users of
+them get one /verify each so their heads are in the service's model cache. The others
+stay cold, so their first /verify loads the model from disk or MinIO. During the run:
+  - --rate > 0 sends requests at that average rate (Poisson arrivals, open loop), with at
+    most --concurrency in flight. Latency is measured from the planned send time, so time
+    spent waiting for a free slot counts when the service falls behind.
+  - --rate 0 keeps --concurrency requests in flight back to back (closed loop).
+
+Each arrival is a /register of a new user (--register-ratio), a /status (--status-ratio)
+or a /verify. A /verify goes to a cold user that has not been verified yet with
+probability --cold-ratio, and to a warm user otherwise.
+
+Example:
+    python load_test.py ./images --users 40 --warm-users 20 --rate 20 --concurrency 32 --duration 120 \
+        --json results/run.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+
+class Stats:
+    def __init__(self):
+        """Latencies and failures per endpoint label."""
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: Dict[str, str] = {}
+
+    def record(self, label: str, latency: float, error: Optional[str] = None):
+        self.latencies[label].append(latency)
+        if error is not None:
+            self.errors[label] += 1
+            self.error_samples.setdefault(label, error)
+
+    def report(self, duration: float) -> Dict[str, dict]:
+        """Summarize every endpoint over a run of duration seconds."""
+        report = {}
+        for label in sorted(self.latencies):
+            latencies = np.array(self.latencies[label]) * 1000.0
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            report[label] = {
+                "requests": len(latencies),
+                "errors": self.errors[label],
+                "error_rate": self.errors[label] / len(latencies),
+                "throughput_rps": len(latencies) / duration,
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "max_ms": float(latencies.max()),
+                "first_error": self.error_samples.get(label)
+            }
+        return report
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace, images: List[bytes]):
+        self.args = args
+        self.images = images
+        self.stats = Stats()
+        self.run_id = uuid.uuid4().hex[:8]
+        self.warm_users: List[str] = []
+        self.cold_users: List[str] = []
+        self.created_users: List[str] = []
+        self.client = httpx.AsyncClient(
+            base_url=args.url,
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        )
+
+    def new_user_id(self) -> str:
+        user_id = f"loadtest-{self.run_id}-{len(self.created_users):05d}"
+        self.created_users.append(user_id)
+        return user_id
+
+    async def request(self, label: str, method: str, path: str, user_id: str,
+                      planned_at: Optional[float] = None, record: bool = True, **kwargs) -> Optional[httpx.Response]:
+        """Send one request and record its latency, counting transport errors and non-2xx answers as errors."""
+        started_at = planned_at if planned_at is not None else time.perf_counter()
+        error = None
+        response = None
+        try:
+            response = await self.client.request(method, path, headers={"X-User-ID": user_id}, **kwargs)
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+        if record:
+            self.stats.record(label, time.perf_counter() - started_at, error)
+        return response
+
+    async def register(self, user_id: str, planned_at: Optional[float] = None, record: bool = True) -> bool:
+        images = random.sample(self.images, min(self.args.register_images, len(self.images)))
+        files = [("files", (f"image_{i:04d}.jpg", image, "image/jpeg")) for i, image in enumerate(images)]
+        response = await self.request("register", "POST", "/register", user_id, planned_at, record, files=files)
+        return response is not None and response.status_code == 200
+
+    async def verify(self, user_id: str, label: str, planned_at: Optional[float] = None, record: bool = True):
+        files = {"file": ("login.jpg", random.choice(self.images), "image/jpeg")}
+        await self.request(label, "POST", "/verify", user_id, planned_at, record, files=files)
+
+    async def status(self, user_id: str, planned_at: Optional[float] = None) -> Optional[str]:
+        response = await self.request("status", "GET", "/status", user_id, planned_at, record=planned_at is not None)
+        if response is None or response.status_code != 200:
+            return None
+        return response.json().get("status")
+
+    async def setup(self):
+        """Register the test users, wait for their training and warm up the warm ones."""
+        print(f"🚀 Registering {self.args.users} users with {self.args.register_images} images each...")
+        user_ids = [self.new_user_id() for _ in range(self.args.users)]
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def register(user_id: str) -> bool:
+            async with semaphore:
+                return await self.register(user_id, record=False)
+
+        registered = await asyncio.gather(*[register(user_id) for user_id in user_ids])
+        pending = {user_id for user_id, ok in zip(user_ids, registered) if ok}
+        print(f"✅ {len(pending)} registrations accepted, waiting for training...")
+
+        trained = []
+        deadline = time.monotonic() + self.args.training_timeout
+        while pending and time.monotonic() < deadline:
+            await asyncio.sleep(5)
+            statuses = await asyncio.gather(*[self.status(user_id) for user_id in pending])
+            for user_id, status in zip(list(pending), statuses):
+                if status == "training_completed":
+                    pending.discard(user_id)
+                    trained.append(user_id)
+                elif status == "training_failed":
+                    pending.discard(user_id)
+            print(f"🔄 {len(trained)} trained, {len(pending)} pending")
+
+        if not trained:
+            raise RuntimeError("No test user finished training")
+
+        trained.sort()
+        self.warm_users = trained[:self.args.warm_users]
+        self.cold_users = trained[self.args.warm_users:]
+        random.shuffle(self.cold_users)
+        for user_id in self.warm_users:
+            await self.verify(user_id, "verify", record=False)
+        print(f"🔥 {len(self.warm_users)} warm users, ❄️  {len(self.cold_users)} cold users")
+
+    def next_operation(self):
+        """Pick the next request of the mix, returns a coroutine factory taking the planned send time."""
+        roll = random.random()
+        known_users = self.warm_users + self.cold_users
+        # With no trained user left to verify or poll, register one instead
+        if roll < self.args.register_ratio or not known_users:
+            user_id = self.new_user_id()
+            return lambda planned_at: self.register(user_id, planned_at)
+
+        if roll < self.args.register_ratio + self.args.status_ratio:
+            user_id = random.choice(known_users)
+            return lambda planned_at: self.status(user_id, planned_at)
+
+        if self.cold_users and (random.random() < self.args.cold_ratio or not self.warm_users):
+            # A cold user is warm after its first /verify
+            user_id = self.cold_users.pop()
+            self.warm_users.append(user_id)
+            return lambda planned_at: self.verify(user_id, "verify_cold", planned_at)
+
+        user_id = random.choice(self.warm_users)
+        return lambda planned_at: self.verify(user_id, "verify_warm", planned_at)
+
+    async def run_open_loop(self, deadline: float):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        tasks = []
+
+        async def send(operation, planned_at: float):
+            async with semaphore:
+                await operation(planned_at)
+
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tasks.append(asyncio.create_task(send(self.next_operation(), next_at)))
+            next_at += random.expovariate(self.args.rate)
+        await asyncio.gather(*tasks)
+
+    async def run_closed_loop(self, deadline: float):
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.next_operation()(time.perf_counter())
+
+        await asyncio.gather(*[worker() for _ in range(self.args.concurrency)])
+
+    async def cleanup(self):
+        print(f"🧹 Deleting {len(self.created_users)} test users...")
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def delete(user_id: str):
+            async with semaphore:
+                await self.request("delete", "DELETE", "/delete", user_id, record=False)
+
+        await asyncio.gather(*[delete(user_id) for user_id in self.created_users])
+
+    async def run(self) -> Dict[str, dict]:
+        try:
+            response = await self.client.get("/health")
+            if response.status_code != 200:
+                raise RuntimeError(f"Service is not healthy: HTTP {response.status_code}")
+
+            await self.setup()
+
+            mode = f"{self.args.rate:g} req/s open loop" if self.args.rate > 0 else "closed loop"
+            print(f"\n⏱️  Running for {self.args.duration:g}s, {mode}, concurrency {self.args.concurrency}...")
+            started_at = time.perf_counter()
+            deadline = started_at + self.args.duration
+            if self.args.rate > 0:
+                await self.run_open_loop(deadline)
+            else:
+                await self.run_closed_loop(deadline)
+            return self.stats.report(time.perf_counter() - started_at)
+
+        finally:
+            if not self.args.keep_users:
+                await self.cleanup()
+            await self.client.aclose()
+
+
+def print_report(report: Dict[str, dict]):
+    print(f"\n{'endpoint':<14}{'requests':>10}{'errors':>8}{'err %':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, row in report.items():
+        print(f"{label:<14}{row['requests']:>10}{row['errors']:>8}{100 * row['error_rate']:>8.1f}"
+              f"{row['throughput_rps']:>9.2f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    for label, row in report.items():
+        if row["first_error"]:
+            print(f"⚠️  {label}: {row['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the face auth service")
+    parser.add_argument("images", help="Folder with face images used for registration and verification")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of load after setup")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum requests in flight")
+    parser.add_argument("--rate", type=float, default=10.0, help="Average arrivals per second, 0 for a closed loop")
+    parser.add_argument("--users", type=int, default=20, help="Users registered during setup")
+    parser.add_argument("--warm-users", type=int, default=10, help="Setup users verified once before the run")
+    parser.add_argument("--cold-ratio", type=float, default=0.1, help="Share of /verify calls going to cold users")
+    parser.add_argument("--register-ratio", type=float, default=0.0, help="Share of arrivals registering a new user")
+    parser.add_argument("--status-ratio", type=float, default=0.1, help="Share of arrivals calling /status")
+    parser.add_argument("--register-images", type=int, default=20, help="Images sent per registration")
+    parser.add_argument("--training-timeout", type=float, default=900.0, help="Seconds to wait for setup training")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--keep-users", action="store_true", help="Do not delete the test users afterwards")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    # Reject inconsistent settings before registering anything
+    if args.users < 1 or args.register_images < 1 or args.concurrency < 1:
+        parser.error("--users, --register-images and --concurrency must be at least 1")
+    if not 0 <= args.warm_users <= args.users:
+        parser.error("--warm-users must be between 0 and --users")
+    if args.duration <= 0 or args.rate < 0:
+        parser.error("--duration must be positive and --rate must not be negative")
+    for name in ("cold_ratio", "register_ratio", "status_ratio"):
+        if not 0 <= getattr(args, name) <= 1:
+            parser.error(f"--{name.replace('_', '-')} must be between 0 and 1")
+    if args.register_ratio + args.status_ratio > 1:
+        parser.error("--register-ratio and --status-ratio must add up to at most 1")
+    if args.json:
+        # Fail before the run, not after it, if the report can't be written
+        try:
+            Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            parser.error(f"--json directory can't be created: {e}")
+
+    folder = Path(args.images)
+    image_files = [path for ext in ("*.jpg", "*.jpeg", "*.png") for path in folder.glob(ext)]
+    if not image_files:
+        print(f"❌ No image files found in {args.images}")
+        sys.exit(1)
+    images = [path.read_bytes() for path in image_files]
+    print(f"📁 Loaded {len(images)} images from {args.images}")
+
+    report = asyncio.run(LoadTest(args, images).run())
+    print_report(report)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"config": vars(args), "endpoints": report}, indent=2))
+        print(f"\n💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()